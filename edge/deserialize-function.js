@@ -1,4 +1,5 @@
 //Given an input string like X_axis_value&Y_axis_value&Z_axis_Value
+//The sample is sent with its epoch timestamp (in seconds)
 var m = msg.payload.data.toString()
-var s = "fanbad,"+m.split('&')[0] + "," + m.split('&')[1] + "," + m.split('&')[2]
+var s = "fanbad,"+m.split('&')[0] + "," + m.split('&')[1] + "," + m.split('&')[2] + "," + Date.now()/1000
 if(m.includes('&')) return {payload:s}
@@ -6,31 +6,56 @@ See CREDITS.txt for other credits
 """
 from __future__ import print_function
 
+from itertools import repeat
+import os
+
 import numpy as np
 
 import logging
 
 
-try:
-    from scipy._lib.six import xrange
-except ImportError:
-    print("Failing to import xrange from scipy._lib.six")
+def _trial(emd, S, timeLine, maxImf, noiseWidth, seed, sign):
+    """
+    One noise-added decomposition of the ensemble. Module level so that
+    it can run on a process pool; the noise only depends on seed.
+    """
+    noise = np.random.default_rng(seed).normal(loc=0, scale=noiseWidth, size=len(S))
+    if sign < 0:
+        noise = -noise
+    IMF, EXT, ITER, imfNo = emd.emd(S + noise, timeLine, maxImf)
+    return IMF, ITER, imfNo
 
 
 class EEMD:
+    """
+    Ensemble EMD: the IMFs are averaged over `trials` decompositions of
+    the signal plus white noise of standard deviation noiseWidth.
+
+        seed: the ensemble is reproducible for a given seed (None: random);
+              every trial gets its own seed derived from it
+        complementary: trials come in pairs using +noise and -noise, whose
+                       residual noise cancels out in the average (trials
+                       is rounded up to an even number)
+
+    eemd() runs the trials on the concurrent.futures executor it is given,
+    if any, e.g. a ProcessPoolExecutor; the result does not depend on the
+    executor nor on its number of workers.
+    """
 
     def __init__(self):
 
         self.__logger = logging.getLogger('EEMD')
         # self.__logger.setLevel(logging.DEBUG)
-        # create console handler and set level to debug
-        ch = logging.StreamHandler()
-        ch.setLevel(logging.DEBUG)
-        formatter = logging.Formatter('%(name)s:%(levelname)s: %(message)s')
-        # add formatter to ch
-        ch.setFormatter(formatter)
-        # add ch to logger
-        self.__logger.addHandler(ch)
+        # create console handler and set level to debug (the logger is
+        # shared with EMD_main.EMD)
+        if not self.__logger.handlers:
+            ch = logging.StreamHandler()
+            ch.setLevel(logging.DEBUG)
+            formatter = logging.Formatter('%(name)s:%(levelname)s: %(message)s')
+            # add formatter to ch
+            ch.setFormatter(formatter)
+            # add ch to logger
+            self.__logger.addHandler(ch)
 
         # Import libraries
         from EMD_main import EMD
@@ -49,6 +74,8 @@ class EEMD:
         # Ensemble constants
         self.noiseWidth = 0.3
         self.trials = 100
+        self.seed = None
+        self.complementary = False
 
         self.EMD = EMD()
         self.EMD.FIXE_H = 5
@@ -60,30 +87,49 @@ class EEMD:
         d = np.diff(S)
         return np.sum(d[1:]*d[:-1]<0)
 
-    def eemd(self, S, timeLine, maxImf=-1):
+    def eemd(self, S, timeLine, maxImf=-1, executor=None):
 
         N = len(S)
-        E_IMF = np.zeros((1,N))
-        E_TIME = np.zeros(1)
-        E_ITER = np.zeros(1)
-
-
-        for trial in xrange(self.trials):
+        if self.complementary:
+            pairs = (self.trials + 1) // 2
+            trials = 2 * pairs
+            seeds = np.random.SeedSequence(self.seed).spawn(pairs)
+            seeds = [s for s in seeds for _ in range(2)]
+            signs = [1, -1] * pairs
+        else:
+            trials = self.trials
+            seeds = np.random.SeedSequence(self.seed).spawn(trials)
+            signs = [1] * trials
+
+        args = (repeat(self.EMD), repeat(S), repeat(timeLine), repeat(maxImf),
+                repeat(self.noiseWidth), seeds, signs)
+        if executor is None:
+            results = map(_trial, *args)
+        else:
+            # a few chunks per core: S is pickled once per chunk
+            chunksize = max(1, trials // (4 * (os.cpu_count() or 1)))
+            results = executor.map(_trial, *args, chunksize=chunksize)
+
+        # accumulated in trial order, whoever computed them
+        capacity = maxImf if maxImf > 0 else int(np.log2(max(N, 2))) + 2
+        E_IMF = np.zeros((capacity, N))
+        E_ITER = np.zeros(capacity)
+        imfMax = 0
+        for trial, (tmpIMF, tmpITER, imfNo) in enumerate(results):
             self.__logger.debug("trial: %s" % trial)
 
-            noise = np.random.normal(loc=0, scale=self.noiseWidth, size=N)
-
-            tmpIMF, tmpEXT, tmpITER, imfNo = self.emd(S+noise, timeLine, maxImf)
-
-            while(E_IMF.shape[0] < imfNo):
-                E_IMF = np.vstack((E_IMF, np.zeros(N)))
-                E_ITER = np.append(E_ITER,0)
+            if imfNo > capacity:
+                capacity = max(imfNo, 2 * capacity)
+                E_IMF = np.vstack((E_IMF, np.zeros((capacity - E_IMF.shape[0], N))))
+                E_ITER = np.append(E_ITER, np.zeros(capacity - E_ITER.shape[0]))
 
-            for n in range(imfNo):
-                E_IMF[n] += tmpIMF[n]
-                E_ITER[n] += tmpITER[n]
+            E_IMF[:imfNo] += tmpIMF
+            E_ITER[:imfNo] += tmpITER
+            imfMax = max(imfMax, imfNo)
 
-        E_IMF /= self.trials
+        E_IMF = E_IMF[:max(imfMax, 1)]
+        E_ITER = E_ITER[:max(imfMax, 1)]
+        E_IMF /= trials
         E_EXT = np.array([self.getExtremaNo(E_IMF[n]) for n in range(E_IMF.shape[0])])
 
         return E_IMF, E_EXT, E_ITER, E_IMF.shape[0]
@@ -126,11 +172,11 @@ if __name__ == "__main__":
     py.title("Original signal")
 
     py.subplot(r,c,2)
-    py.plot([EXT[i] for i in xrange(imfNo)], 'o')
+    py.plot([EXT[i] for i in range(imfNo)], 'o')
     py.title("Number of extrema")
 
     py.subplot(r,c,3)
-    py.plot([ITER[i] for i in xrange(imfNo)], 'o')
+    py.plot([ITER[i] for i in range(imfNo)], 'o')
     py.title("Number of iterations")
 
     def extF(s):
@@ -138,7 +184,7 @@ if __name__ == "__main__":
         state2 = np.r_[np.abs(s[1:-1]) > np.abs(s[2:])]
         return np.arange(1,len(s)-1)[state1 & state2]
 
-    for num in xrange(imfNo):
+    for num in range(imfNo):
         py.subplot(r,c,num+4)
         py.plot(timeLine, IMF[num],'g')
         #~ py.plot(timeLine[extF(IMF[num])], IMF[num][extF(IMF[num])],'ok')
@@ -7,24 +7,29 @@ See CREDITS.txt for other credits
 from __future__ import print_function
 
 import os
-import time
 
 import numpy as np
 from scipy.interpolate import interp1d
 import logging
 
+import inviluppi
+
 class EMD:
     def __init__(self):
         self.__logger = logging.getLogger('EEMD')
         # self.__logger.setLevel(logging.DEBUG)
-        # create console handler and set level to debug
-        ch = logging.StreamHandler()
-        ch.setLevel(logging.DEBUG)
-        formatter = logging.Formatter('%(name)s:%(levelname)s: %(message)s')
-        # add formatter to ch
-        ch.setFormatter(formatter)
-        # add ch to logger
-        self.__logger.addHandler(ch)
+        # create console handler and set level to debug (only once: every
+        # instance shares the same logger)
+        if not self.__logger.handlers:
+            ch = logging.StreamHandler()
+            ch.setLevel(logging.DEBUG)
+            formatter = logging.Formatter('%(name)s:%(levelname)s: %(message)s')
+            # add formatter to ch
+            ch.setFormatter(formatter)
+            # add ch to logger
+            self.__logger.addHandler(ch)
+        self._debug = False
+        self._inviluppi = None
 
         # Declare constants
         self.stdThreshold = 0.2
@@ -43,6 +48,8 @@ class EMD:
         self.plotPath = 'splineTest'
 
         self.splineKind = 'akima'
+        # interpolate the envelopes with inviluppi.Inviluppi
+        self.fastEnvelopes = True
 
         self.DTYPE = np.float64
         self.FIXE = 0
@@ -86,12 +93,13 @@ class EMD:
         # q = (1-t)*y0 + t*y1 + t*(1-t)*(a*(1-t) + b*t)
         return (1 - t) * P0 + t * P1 + t * (1 - t) * (a * (1 - t) + b * t)
 
-    def extractMaxMinSpline(self, T, S):
+    def extractMaxMinSpline(self, T, S, extrema=None):
         """
         Input:
         -----------------
             T - Time array.
             S - Signal.
+            extrema - Result of _extremaIndices(S), if already known.
 
         Output:
         -----------------
@@ -105,13 +113,11 @@ class EMD:
         # Get indexes of extrema
         # ~ maxPos, maxVal, minPos, minVal = self.findExtrema(T, S)
         # ~ maxPos, maxVal, minPos, minVal = self.findExtrema_new(T, S)
-        maxPos, maxVal, minPos, minVal, indzer = self.findExtrema_simple(T, S)
+        if extrema is None:
+            extrema = self._extremaIndices(S)
+        indmax, indmin, indzer = extrema
 
-        if maxPos.dtype != self.DTYPE: self.__logger.debug('maxPos.dtype: %s' % maxPos.dtype)
-        if maxVal.dtype != self.DTYPE: self.__logger.debug('maxVal.dtype: %s' % maxVal.dtype)
-        if minPos.dtype != self.DTYPE: self.__logger.debug('minPos.dtype: %s' % minPos.dtype)
-        if minVal.dtype != self.DTYPE: self.__logger.debug('minVal.dtype: %s' % minVal.dtype)
-        if len(maxPos) + len(minPos) < 3: return [-1] * 4
+        if len(indmax) + len(indmin) < 3: return [-1] * 4
 
         #########################################
         # Prepare spline
@@ -121,14 +127,28 @@ class EMD:
 
         # Extrapolation of signal (ober boundaries)
         # ~ maxExtrema, minExtrema = self.preparePoints(T, S, maxPos, maxVal, minPos, minVal)
-        maxExtrema, minExtrema = self.preparePoints_coppiedFromMatlab(T, S, maxPos, maxVal, minPos, minVal)
+        maxExtrema, minExtrema = self._mirrorPoints(T, S, indmax, indmin)
+
+        # Both envelopes at once (see inviluppi.py), when possible
+        kind = self.splineKind.lower()
+        if (self.fastEnvelopes and kind in inviluppi.COEFFICIENTI
+                and maxExtrema.shape[1] > 3 and minExtrema.shape[1] > 3):
+            # read once: another thread may replace it for another timeline
+            envelopes = self._inviluppi
+            if envelopes is None or (envelopes.T is not T and not np.array_equal(envelopes.T, T)):
+                envelopes = self._inviluppi = inviluppi.Inviluppi(T)
+            if envelopes.copre(maxExtrema, minExtrema):
+                maxSpline, minSpline = envelopes.valuta(maxExtrema, minExtrema, kind, self.DTYPE)
+                if kind == 'cubic':
+                    maxSpline, minSpline = maxSpline.astype(self.DTYPE), minSpline.astype(self.DTYPE)
+                return maxSpline, minSpline, maxExtrema, minExtrema
 
         maxTSpline, maxSpline = self.splinePoints(T, maxExtrema, self.splineKind)
         minTSpline, minSpline = self.splinePoints(T, minExtrema, self.splineKind)
 
-        if maxExtrema.dtype != self.DTYPE: self.__logger.debug('maxExtrema.dtype: %s' % maxExtrema.dtype)
-        if maxSpline.dtype != self.DTYPE: self.__logger.debug('maxSpline.dtype: %s' % maxSpline.dtype)
-        if maxTSpline.dtype != self.DTYPE: self.__logger.debug('maxTSline.dtype: %s' % maxTSpline.dtype)
+        if self._debug and maxExtrema.dtype != self.DTYPE: self.__logger.debug('maxExtrema.dtype: %s' % maxExtrema.dtype)
+        if self._debug and maxSpline.dtype != self.DTYPE: self.__logger.debug('maxSpline.dtype: %s' % maxSpline.dtype)
+        if self._debug and maxTSpline.dtype != self.DTYPE: self.__logger.debug('maxTSline.dtype: %s' % maxTSpline.dtype)
 
         return maxSpline, minSpline, maxExtrema, minExtrema
 
@@ -288,16 +308,25 @@ class EMD:
             minExtrema: Position (1st row) and values (2nd row) of maxima.
         """
 
-        # Find indexes of pass
-        indmin = np.array([np.nonzero(T == t)[0] for t in minPos]).flatten()
-        indmax = np.array([np.nonzero(T == t)[0] for t in maxPos]).flatten()
+        # Find indexes of pass (T is sorted)
+        indmin = np.searchsorted(T, minPos)
+        indmax = np.searchsorted(T, maxPos)
+
+        return self._mirrorPoints(T, S, indmax, indmin)
+
+    def _mirrorPoints(self, T, S, indmax, indmin):
+        """
+        Same as preparePoints_coppiedFromMatlab, working on the indexes
+        of maxima and minima in T and S (as returned by _extremaIndices):
+        the cost depends only on the number of extrema.
+        """
 
-        if S.dtype != self.DTYPE: self.__logger.debug('S.dtype: %s' % S.dtype)
-        if T.dtype != self.DTYPE: self.__logger.debug('T.dtype: %s' % T.dtype)
+        if self._debug and S.dtype != self.DTYPE: self.__logger.debug('S.dtype: %s' % S.dtype)
+        if self._debug and T.dtype != self.DTYPE: self.__logger.debug('T.dtype: %s' % T.dtype)
 
         # Local variables
         nbsym = self.nbsym
-        endMin, endMax = len(minPos), len(maxPos)
+        endMin, endMax = len(indmin), len(indmax)
 
         ####################################
         # Left bound - mirror nbsym points to the left
@@ -392,7 +421,7 @@ class EMD:
 
         maxExtrema = np.array([tmax, zmax])
         minExtrema = np.array([tmin, zmin])
-        if maxExtrema.dtype != self.DTYPE: self.__logger.debug('maxExtrema.dtype: %s' % maxExtrema.dtype)
+        if self._debug and maxExtrema.dtype != self.DTYPE: self.__logger.debug('maxExtrema.dtype: %s' % maxExtrema.dtype)
 
         # Make double sure, that each extremum is significant
         maxExtrema = np.delete(maxExtrema, np.where(maxExtrema[0, 1:] == maxExtrema[0, :-1]), axis=1)
@@ -418,8 +447,8 @@ class EMD:
 
         kind = splineKind.lower()
         t = T[np.r_[T >= extrema[0, 0]] & np.r_[T <= extrema[0, -1]]]
-        if t.dtype != self.DTYPE: self.__logger.debug('t.dtype: %s' % t.dtype)
-        if extrema.dtype != self.DTYPE: self.__logger.debug('extrema.dtype: %s' % extrema.dtype)
+        if self._debug and t.dtype != self.DTYPE: self.__logger.debug('t.dtype: %s' % t.dtype)
+        if self._debug and extrema.dtype != self.DTYPE: self.__logger.debug('extrema.dtype: %s' % extrema.dtype)
 
         if kind == "akima":
             return t, self.akima(extrema[0], extrema[1], t)
@@ -502,7 +531,7 @@ class EMD:
         dx = np.diff(X)
         dy = np.diff(Y)
 
-        if dx.dtype != self.DTYPE: self.__logger.debug('dx.dtype: %s' % dx.dtype)
+        if self._debug and dx.dtype != self.DTYPE: self.__logger.debug('dx.dtype: %s' % dx.dtype)
 
         if np.any(dx <= 0):
             raise Exception('input x-array must be in strictly ascending order')
@@ -513,7 +542,7 @@ class EMD:
         # d - approximation of derivative
         # p, n - previous, next
         d = dy / dx
-        if d.dtype != self.DTYPE: self.__logger.debug('d.dtype: %s' % d.dtype)
+        if self._debug and d.dtype != self.DTYPE: self.__logger.debug('d.dtype: %s' % d.dtype)
 
         dpp = 2 * d[0] - d[1]
         dp = 2 * dpp - d[0]
@@ -537,9 +566,9 @@ class EMD:
         a2 = (3.0 * d - 2.0 * a1[0:n - 1] - a1[1:n]) / dx
         a3 = (a1[0:n - 1] + a1[1:n] - 2.0 * d) / (dx * dx)
 
-        if a1.dtype != self.DTYPE: self.__logger.debug('a1.dtype: %s' % a1.dtype)
-        if a2.dtype != self.DTYPE: self.__logger.debug('a2.dtype: %s' % a2.dtype)
-        if a3.dtype != self.DTYPE: self.__logger.debug('a3.dtype: %s' % a3.dtype)
+        if self._debug and a1.dtype != self.DTYPE: self.__logger.debug('a1.dtype: %s' % a1.dtype)
+        if self._debug and a2.dtype != self.DTYPE: self.__logger.debug('a2.dtype: %s' % a2.dtype)
+        if self._debug and a3.dtype != self.DTYPE: self.__logger.debug('a3.dtype: %s' % a3.dtype)
 
         bins = np.digitize(x, X)
         bins = np.minimum(bins, n - 1) - 1
@@ -548,8 +577,8 @@ class EMD:
 
         out = ((_x * a3[bb] + a2[bb]) * _x + a1[bb]) * _x + Y[bb]
 
-        if _x.dtype != self.DTYPE: self.__logger.debug('_x.dtype: %s' % _x.dtype)
-        if out.dtype != self.DTYPE: self.__logger.debug('out.dtype: %s' % out.dtype)
+        if self._debug and _x.dtype != self.DTYPE: self.__logger.debug('_x.dtype: %s' % _x.dtype)
+        if self._debug and out.dtype != self.DTYPE: self.__logger.debug('out.dtype: %s' % out.dtype)
 
         return out
 
@@ -690,6 +719,21 @@ class EMD:
             indzer: Indexes of zero crossings.
         """
 
+        indmax, indmin, indzer = self._extremaIndices(s)
+
+        localMaxPos = t[indmax]
+        localMaxVal = s[indmax]
+        localMinPos = t[indmin]
+        localMinVal = s[indmin]
+
+        return localMaxPos, localMaxVal, localMinPos, localMinVal, indzer
+
+    def _extremaIndices(self, s):
+        """
+        Indexes of the local maxima, of the local minima and of the
+        zero-crossings of s, as integer arrays (see findExtrema_simple).
+        """
+
         # Finds indexes of zero-crossings
         s1, s2 = s[:-1], s[1:]
         indzer = np.nonzero(s1 * s2 < 0)[0]
@@ -755,23 +799,19 @@ class EMD:
                 for x in imin: indmin.append(int(x))
                 indmin.sort()
 
-        localMaxPos = t[indmax]
-        localMaxVal = s[indmax]
-        localMinPos = t[indmin]
-        localMinVal = s[indmin]
+        return np.asarray(indmax, dtype=np.intp), np.asarray(indmin, dtype=np.intp), indzer
 
-        return localMaxPos, localMaxVal, localMinPos, localMinVal, indzer
+    def endCondition(self, tmp):
+        """
+        When to stop EMD.
 
-    def endCondition(self, Res, IMF):
-        # When to stop EMD
-        tmp = Res.copy()
-        for imfNo in IMF.keys():
-            tmp -= IMF[imfNo]
+        tmp: residual, i.e. the scaled signal minus all the IMFs found so far.
+        """
 
-            # ~ # Power is enought
-            # ~ if np.log10(np.abs(tmp).sum()/np.abs(Res).sum()) < powerThreshold:
-            # ~ print "FINISHED -- POWER RATIO"
-            # ~ return True
+        # ~ # Power is enought
+        # ~ if np.log10(np.abs(tmp).sum()/np.abs(Res).sum()) < powerThreshold:
+        # ~ print "FINISHED -- POWER RATIO"
+        # ~ return True
 
         if np.max(tmp) - np.min(tmp) < self.rangeThreshold:
             self.__logger.debug("FINISHED -- RANGE")
@@ -818,7 +858,7 @@ class EMD:
         """
         Performs Emerical Mode Decomposition on signal S.
         The decomposition is limited to maxImf imf. No limitation as default.
-        Returns IMF functions in dic format. IMF = {0:imf0, 1:imf1...}.
+        Returns IMF functions as rows of a 2D array. IMF[0] = imf0, ...
 
         Input:
         ---------
@@ -829,78 +869,78 @@ class EMD:
 
         Output:
         ---------
-        return IMF, EXT, TIME, ITER, imfNo
-            IMF: Signal IMFs in dictionary type. IMF = {0:imf0, 1:imf1...}
-            EXT: Number of extrema for each IMF. IMF = {0:ext0, 1:ext1...}
-            ITER: Number of iteration for each IMF.
+        return IMF, EXT, ITER, imfNo
+            IMF: Signal IMFs, array of shape (imfNo, len(S)).
+            EXT: Number of extrema for each IMF (array of imfNo values).
+            ITER: Number of iteration for each IMF (array of imfNo values).
             imfNo: Number of IMFs.
+
+        The sifting works on preallocated buffers: the residual is kept
+        incrementally instead of being summed again from all the IMFs, and
+        the extrema of each sifted imf are found only once per iteration
+        (they serve the envelopes, the stopping criteria and the next
+        iteration). Debug checks only run when the logger is enabled for
+        DEBUG.
         """
 
         if timeLine is None: timeLine = np.arange(len(S), dtype=S.dtype)
         if maxImf is None: maxImf = -1
 
+        self._debug = self.__logger.isEnabledFor(logging.DEBUG)
+
         # Make sure same types are dealt
         S, timeLine = self._common_dtype(S, timeLine)
         self.DTYPE = S.dtype
 
-        Res = S.astype(self.DTYPE)
-        scale = (max(Res) - min(Res)) / self.scaleFactor
-        Res, scaledS = Res / scale, S / scale
-        imf = np.zeros(len(S), dtype=self.DTYPE)
-        imfOld = Res.copy()
-
-        N = len(S)
-
-        if Res.dtype != self.DTYPE:      self.__logger.debug('Res.dtype: %s' % Res.dtype)
-        if scaledS.dtype != self.DTYPE:  self.__logger.debug('scaledS.dtype: %s' % scaledS.dtype)
-        if imf.dtype != self.DTYPE:      self.__logger.debug('imf.dtype: %s' % imf.dtype)
-        if imfOld.dtype != self.DTYPE:   self.__logger.debug('imfOld.dtype: %s' % imfOld.dtype)
-        if timeLine.dtype != self.DTYPE: self.__logger.debug('timeLine.dtype: %s' % timeLine.dtype)
-
         if S.shape != timeLine.shape:
             info = "Time array should be the same size as signal."
             raise Exception(info)
 
-        # Create arrays
-        IMF = {}  # Dic for imfs signals
-        EXT = {}  # Dic for number of extrema
-        TIME = {}  # Dic for time computing of single imf
-        ITER = {}  # Dic for number of iterations
+        N = len(S)
+        scale = (max(S) - min(S)) / self.scaleFactor
+        scaledS = S / scale
+
+        # Work buffers
+        imfSum = np.zeros(N, dtype=self.DTYPE)  # sum of the IMFs found so far
+        resto = scaledS.copy()                  # scaledS - IMF[0] - IMF[1] - ...
+        imf = np.empty(N, dtype=self.DTYPE)
+        mean = np.empty(N, dtype=self.DTYPE)
+
+        if self._debug:
+            if scaledS.dtype != self.DTYPE:  self.__logger.debug('scaledS.dtype: %s' % scaledS.dtype)
+            if timeLine.dtype != self.DTYPE: self.__logger.debug('timeLine.dtype: %s' % timeLine.dtype)
+
+        # IMFs are stored as rows of a contiguous array, grown if needed
+        capacity = maxImf if maxImf > 0 else int(np.log2(max(N, 2))) + 2
+        IMF = np.empty((capacity, N), dtype=self.DTYPE)
+        EXT = np.zeros(capacity, dtype=int)
+        ITER = np.zeros(capacity, dtype=int)
         imfNo = 0
         notFinish = True
 
-        time0 = time.time()
+        if self.PLOT:
+            import pylab as py
+
+        # Start on-screen displaying
+        if self.PLOT and self.INTERACTIVE:
+            py.ion()
 
         while (notFinish):
-            self.__logger.debug('IMF -- %s' % imfNo)
+            if self._debug: self.__logger.debug('IMF -- %s' % imfNo)
 
-            Res = scaledS - np.sum([IMF[i] for i in range(imfNo)], axis=0)
-            # ~ Res -= imf
-            imf = Res.copy()
-            mean = np.zeros(len(S), dtype=self.DTYPE)
+            np.subtract(scaledS, imfSum, out=imf)
+            mean.fill(0)
+            ext = self._extremaIndices(imf)
 
             # Counters
             n = 0  # All iterations for current imf.
             n_h = 0  # counts when |#zero - #ext| <=1
 
-            t0 = time.time()
-            singleTime = time.time()
-
-            if self.PLOT:
-                import pylab as py
-
-            # Start on-screen displaying
-            if self.PLOT and self.INTERACTIVE:
-                py.ion()
-
             while (n < self.MAX_ITERATION):
                 n += 1
 
-                # Time of single iteration
-                singleTime = time.time()
-
-                maxPos, maxVal, minPos, minVal, indzer = self.findExtrema_simple(timeLine, imf)
-                extNo = len(minPos) + len(maxPos)
+                indmax, indmin, indzer = ext
+                extNo = len(indmin) + len(indmax)
                 nzm = len(indzer)
 
                 if extNo > 2:
@@ -920,21 +960,24 @@ class EMD:
                             fName = "imf{}_{:02}".format(imfNo, n - 1)
                             py.savefig(os.path.join(self.plotPath, fName))
 
-                    imfOld = imf.copy()
-                    imf = imf - self.reduceScale * mean
+                    if self.reduceScale == 1:
+                        imf -= mean
+                    else:
+                        imf -= self.reduceScale * mean
 
-                    maxEnv, minEnv, eMax, eMin = self.extractMaxMinSpline(timeLine, imf)
+                    ext = self._extremaIndices(imf)
+                    maxEnv, minEnv, eMax, eMin = self.extractMaxMinSpline(timeLine, imf, ext)
 
                     if type(maxEnv) == type(-1):
                         notFinish = True
                         break
 
-                    mean = 0.5 * (maxEnv + minEnv)
+                    np.add(maxEnv, minEnv, out=mean)
+                    mean *= 0.5
 
-                    if maxEnv.dtype != self.DTYPE: self.__logger.debug('maxEnvimf.dtype: %s' % maxEnv.dtype)
-                    if minEnv.dtype != self.DTYPE: self.__logger.debug('minEnvimf.dtype: %s' % minEnvimf.dtype)
-                    if imf.dtype != self.DTYPE:    self.__logger.debug('imf.dtype: %s' % imf.dtype)
-                    if mean.dtype != self.DTYPE:   self.__logger.debug('mean.dtype: %s' % mean.dtype)
+                    if self._debug:
+                        if maxEnv.dtype != self.DTYPE: self.__logger.debug('maxEnvimf.dtype: %s' % maxEnv.dtype)
+                        if minEnv.dtype != self.DTYPE: self.__logger.debug('minEnvimf.dtype: %s' % minEnv.dtype)
 
                     # Fix number of iterations
                     if self.FIXE:
@@ -944,9 +987,9 @@ class EMD:
                     # and extrema differ at most by one.
                     elif self.FIXE_H:
 
-                        maxPos, maxVal, minPos, minVal, indZer = self.findExtrema_simple(timeLine, imf)
-                        extNo = len(maxPos) + len(minPos)
-                        nzm = len(indZer)
+                        indmax, indmin, indzer = ext
+                        extNo = len(indmax) + len(indmin)
+                        nzm = len(indzer)
 
                         if n == 1: continue
                         if abs(extNo - nzm) > 1:
@@ -965,9 +1008,9 @@ class EMD:
                     # Stops after default stopping criteria are meet.
                     else:
 
-                        maxPos, maxVal, minPos, minVal, indZer = self.findExtrema_simple(timeLine, imf)
-                        extNo = len(maxPos) + len(minPos)
-                        nzm = len(indZer)
+                        indmax, indmin, indzer = ext
+                        extNo = len(indmax) + len(indmin)
+                        nzm = len(indzer)
 
                         f1 = self.checkImf(imf, maxEnv, minEnv, mean, extNo)
                         # f2 = np.all(maxVal>0) and np.all(minVal<0)
@@ -977,17 +1020,22 @@ class EMD:
                         if f1 and f2: break
 
                 else:
-                    EXT[imfNo] = extNo
                     notFinish = False
                     break
 
-            IMF[imfNo] = imf.copy()
+            if imfNo == capacity:
+                capacity *= 2
+                IMF = np.resize(IMF, (capacity, N))
+                EXT = np.resize(EXT, capacity)
+                ITER = np.resize(ITER, capacity)
+            IMF[imfNo] = imf
             ITER[imfNo] = n
             EXT[imfNo] = extNo
-            TIME[imfNo] = time.time() - t0
             imfNo += 1
 
-            if self.endCondition(scaledS, IMF) or imfNo == maxImf:
+            imfSum += imf
+            resto -= imf
+            if self.endCondition(resto) or imfNo == maxImf:
                 notFinish = False
                 break
 
@@ -999,12 +1047,129 @@ class EMD:
         # ~ EXT[imfNo] = self.getExtremaNo(Res)
         # ~ TIME[imfNo] = 0
         # ~ imfNo += 1
-        time1 = time.time()
 
-        for key in IMF.keys():
-            IMF[key] *= scale
-        # return IMF, EXT, TIME, ITER, imfNo
+        IMF = IMF[:imfNo]
+        IMF *= scale
+        return IMF, EXT[:imfNo], ITER[:imfNo], imfNo
+
+
+    def emdStacked(self, S, timeLine=None, maxImf=None):
+        """
+        Stacked sifting of the channels of a multichannel signal (e.g. the
+        X, Y, Z axes of one accelerometer): the channels are sifted
+        together and share the stopping criteria, so that IMF k has the
+        same number of sifting iterations on every channel and all the
+        channels have the same number of IMFs. The decomposition stops
+        as soon as one channel is left without oscillations.
+
+        Input:
+        ---------
+            S: Signal, array of shape (channels, len(timeLine)).
+            timeLine, maxImf: see emd.
+
+        Output:
+        ---------
         return IMF, EXT, ITER, imfNo
+            IMF: array of shape (channels, imfNo, len(timeLine)).
+            EXT: Number of extrema for each IMF and channel (imfNo, channels).
+            ITER: Number of iteration for each IMF (array of imfNo values).
+            imfNo: Number of IMFs.
+        """
+
+        S = np.asarray(S)
+        C, N = S.shape
+        if timeLine is None: timeLine = np.arange(N, dtype=S.dtype)
+        if maxImf is None: maxImf = -1
+
+        self._debug = self.__logger.isEnabledFor(logging.DEBUG)
+
+        S, timeLine = self._common_dtype(S, timeLine)
+        self.DTYPE = S.dtype
+
+        if N != len(timeLine):
+            info = "Time array should be the same size as signal."
+            raise Exception(info)
+
+        # every channel is scaled on its own range
+        scale = (np.max(S, axis=1) - np.min(S, axis=1)) / self.scaleFactor
+        resto = S / scale[:, None]
+        imf = np.empty_like(resto)
+        mean = np.empty_like(resto)
+        imfOld = np.empty_like(resto)
+
+        capacity = maxImf if maxImf > 0 else int(np.log2(max(N, 2))) + 2
+        IMF = np.empty((capacity, C, N), dtype=self.DTYPE)
+        EXT = np.zeros((capacity, C), dtype=int)
+        ITER = np.zeros(capacity, dtype=int)
+        imfNo = 0
+        notFinish = True
+
+        while (notFinish):
+            if self._debug: self.__logger.debug('IMF -- %s' % imfNo)
+
+            imf[:] = resto
+            mean.fill(0)
+            ext = [self._extremaIndices(imf[c]) for c in range(C)]
+
+            n = 0
+            n_h = 0
+
+            while (n < self.MAX_ITERATION):
+                n += 1
+
+                extNo = [len(e[0]) + len(e[1]) for e in ext]
+                if min(extNo) <= 2:
+                    notFinish = False
+                    break
+
+                if not (self.FIXE or self.FIXE_H): imfOld[:] = imf
+                if self.reduceScale == 1:
+                    imf -= mean
+                else:
+                    imf -= self.reduceScale * mean
+
+                ext = [self._extremaIndices(imf[c]) for c in range(C)]
+                extNo = [len(e[0]) + len(e[1]) for e in ext]
+                inviluppi = [self.extractMaxMinSpline(timeLine, imf[c], ext[c]) for c in range(C)]
+                if any(type(inv[0]) == type(-1) for inv in inviluppi):
+                    break
+                for c, (maxEnv, minEnv, eMax, eMin) in enumerate(inviluppi):
+                    np.add(maxEnv, minEnv, out=mean[c])
+                mean *= 0.5
+
+                if self.FIXE:
+                    if n >= self.FIXE + 1: break
+
+                # every channel must have as many zero-crossings as extrema
+                elif self.FIXE_H:
+                    if n == 1: continue
+                    if all(abs(extNo[c] - len(ext[c][2])) <= 1 for c in range(C)):
+                        n_h += 1
+                    else:
+                        n_h = 0
+                    if n_h >= self.FIXE_H: break
+
+                elif n > 1 and all(abs(extNo[c] - len(ext[c][2])) < 2 and
+                                   self.checkImf(imf[c], imfOld[c], inviluppi[c][2], inviluppi[c][3], mean[c])
+                                   for c in range(C)):
+                    break
+
+            if imfNo == capacity:
+                capacity *= 2
+                IMF = np.resize(IMF, (capacity, C, N))
+                EXT = np.resize(EXT, (capacity, C))
+                ITER = np.resize(ITER, capacity)
+            IMF[imfNo] = imf
+            ITER[imfNo] = n
+            EXT[imfNo] = extNo
+            imfNo += 1
+
+            resto -= imf
+            if all(self.endCondition(resto[c]) for c in range(C)) or imfNo == maxImf:
+                notFinish = False
+
+        IMF = IMF[:imfNo] * scale[None, :, None]
+        return IMF.transpose(1, 0, 2), EXT[:imfNo], ITER[:imfNo], imfNo
 
 
 ###################################################
@@ -1067,7 +1232,7 @@ if __name__ == "__main__":
         return np.arange(1, len(s) - 1)[state1 & state2]
 
 
-    for num in xrange(imfNo):
+    for num in range(imfNo):
         py.subplot(r, c, num + 2)
         py.plot(timeLine, IMF[num], 'g')
         # ~ py.plot(timeLine[extF(IMF[num])], IMF[num][extF(IMF[num])],'ok')
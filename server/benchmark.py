@@ -0,0 +1,375 @@
+"""
+Micro-benchmarks of the signal processing pipeline.
+
+    python benchmark.py            runs every benchmark
+    python benchmark.py mhs ...    runs only the given ones
+
+Every benchmark compares the current implementation with the one it
+replaced (kept here as a reference) and checks that they agree.
+"""
+from __future__ import print_function
+
+import json
+import sys
+import time
+
+import numpy as np
+
+import decomposizione
+import detect_peaks
+from detect_peaks_104 import detect_peaks as _detect_peaks_originale
+import inviluppi
+from emd_streaming import EMDStreaming
+import spettro
+import utils
+import wire
+
+
+def misura(fn, *args, **kwargs):
+    """Best wall-clock time in seconds over a few runs of fn(*args)."""
+    ripetizioni = kwargs.pop('ripetizioni', 5)
+    best = float('inf')
+    for _ in range(ripetizioni):
+        t0 = time.time()
+        fn(*args, **kwargs)
+        best = min(best, time.time() - t0)
+    return best
+
+
+def riga(nome, n, t_old, t_new):
+    print("%-12s n=%-7d prima: %10.3f ms  dopo: %8.3f ms  speedup: %7.1fx"
+          % (nome, n, t_old * 1e3, t_new * 1e3, t_old / t_new))
+
+
+def imf_di_prova(n, seed=0):
+    """A noisy chirp, as amplitude and instantaneous frequency of its IMF."""
+    rng = np.random.RandomState(seed)
+    t = np.linspace(0, n, n)
+    s = np.sin(2 * np.pi * (0.05 + 1e-5 * t) * t) + 0.1 * rng.randn(n)
+    _, amp, phase = utils.hilb(s, unwrap=True)
+    freq = np.diff(phase) / (2 * np.pi) / n
+    return amp, freq
+
+
+###################################################
+## utils.mhs
+
+def _mhs_originale(amplitude, freq):
+    f = np.array(freq)
+    HS = np.array(amplitude)
+    Atemp = []
+    F = []
+    while f.size != 0:
+        indx = np.argwhere(f == f[0]).flatten()
+        F += [f[0]]
+        Atemp += [np.sum(HS[indx])]
+        HS[indx] = 0
+        f[indx] = 0
+        HS = HS[HS != 0]
+        f = f[f != 0]
+    F = np.array(F)
+    indx = np.argsort(F)
+    return np.array(Atemp)[indx], F[indx]
+
+
+def bench_mhs():
+    for n in (100, 1000, 10000):
+        amp, freq = imf_di_prova(n)
+        # instantaneous frequencies of real IMFs repeat rarely: the
+        # original loop is quadratic in the number of distinct values
+        A_old, F_old = _mhs_originale(amp, freq)
+        A_new, F_new = utils.mhs(amp, freq)
+        assert np.array_equal(F_old, F_new) and np.allclose(A_old, A_new)
+        rip = 1 if n > 1000 else 5
+        riga('mhs', n, misura(_mhs_originale, amp, freq, ripetizioni=rip),
+             misura(utils.mhs, amp, freq))
+        edges = np.linspace(freq.min(), freq.max(), 65)
+        riga('mhs(bins)', n, misura(_mhs_originale, amp, freq, ripetizioni=rip),
+             misura(utils.mhs, amp, freq, bins=edges))
+
+
+###################################################
+## detect_peaks
+
+def bench_detect_peaks():
+    # exact agreement on random signals and options: test_detect_peaks.py
+    rng = np.random.RandomState(0)
+    for n in (10 ** 4, 10 ** 5, 10 ** 6):
+        # power spectrum of a noisy signal: about n/3 local maxima
+        ps = np.abs(np.fft.rfft(rng.randn(2 * n)))[:n] ** 2
+        for kpsh in (False, True):
+            t_new = misura(detect_peaks.detect_peaks, ps, mpd=5, kpsh=kpsh, ripetizioni=3)
+            # the original takes minutes at 10**6: a single run
+            t0 = time.time()
+            atteso = _detect_peaks_originale(ps, mpd=5, kpsh=kpsh)
+            t_old = time.time() - t0
+            assert np.array_equal(atteso, detect_peaks.detect_peaks(ps, mpd=5, kpsh=kpsh))
+            riga('peaks(kpsh)' if kpsh else 'peaks', n, t_old, t_new)
+    # 256 spectra of 1024 bins at once
+    spettri = np.abs(np.fft.rfft(rng.randn(256, 2048)))[:, :1024] ** 2
+    t_old = misura(lambda: [_detect_peaks_originale(s, mpd=5) for s in spettri], ripetizioni=1)
+    riga('peaks(batch)', spettri.size, t_old,
+         misura(detect_peaks.detect_peaks_batch, spettri, mpd=5))
+
+
+###################################################
+## EMD_main.EMD.emd
+
+def _inviluppi_originali(emd, T, S):
+    """extractMaxMinSpline, with extrema located by scanning the timeline."""
+    maxPos, maxVal, minPos, minVal, indzer = emd.findExtrema_simple(T, S)
+    if len(maxPos) + len(minPos) < 3: return [-1] * 4
+    indmin = np.array([np.nonzero(T == t)[0] for t in minPos]).flatten()
+    indmax = np.array([np.nonzero(T == t)[0] for t in maxPos]).flatten()
+    maxExtrema, minExtrema = emd._mirrorPoints(T, S, indmax, indmin)
+    maxSpline = emd.splinePoints(T, maxExtrema, emd.splineKind)[1]
+    minSpline = emd.splinePoints(T, minExtrema, emd.splineKind)[1]
+    return maxSpline, minSpline, maxExtrema, minExtrema
+
+
+def _emd_originale(emd, S, timeLine):
+    """The sifting loop before EMD.emd worked in place on extrema indexes (FIXE_H only)."""
+    S, timeLine = emd._common_dtype(S, timeLine)
+    emd.DTYPE = S.dtype
+    scale = (max(S) - min(S)) / emd.scaleFactor
+    scaledS = S / scale
+    IMF, EXT, ITER = {}, {}, {}
+    imfNo = 0
+    notFinish = True
+    while notFinish:
+        Res = scaledS - np.sum([IMF[i] for i in range(imfNo)], axis=0)
+        imf = Res.copy()
+        mean = np.zeros(len(S), dtype=emd.DTYPE)
+        n = n_h = 0
+        while n < emd.MAX_ITERATION:
+            n += 1
+            maxPos, maxVal, minPos, minVal, indzer = emd.findExtrema_simple(timeLine, imf)
+            extNo = len(minPos) + len(maxPos)
+            if extNo > 2:
+                imf = imf - emd.reduceScale * mean
+                maxEnv, minEnv, eMax, eMin = _inviluppi_originali(emd, timeLine, imf)
+                if type(maxEnv) == type(-1):
+                    break
+                mean = 0.5 * (maxEnv + minEnv)
+                maxPos, maxVal, minPos, minVal, indZer = emd.findExtrema_simple(timeLine, imf)
+                extNo = len(maxPos) + len(minPos)
+                if n == 1: continue
+                n_h = 0 if abs(extNo - len(indZer)) > 1 else n_h + 1
+                if n_h >= emd.FIXE_H: break
+            else:
+                notFinish = False
+                break
+        IMF[imfNo] = imf.copy()
+        ITER[imfNo] = n
+        EXT[imfNo] = extNo
+        imfNo += 1
+        tmp = scaledS.copy()
+        for i in IMF.keys():
+            tmp -= IMF[i]
+        if np.max(tmp) - np.min(tmp) < emd.rangeThreshold or np.sum(np.abs(tmp)) < emd.totalPowerThreshold:
+            notFinish = False
+    for i in IMF.keys():
+        IMF[i] *= scale
+    return IMF, EXT, ITER, imfNo
+
+
+def bench_emd():
+    rng = np.random.RandomState(0)
+    for n in (100, 1024, 16384):
+        S = rng.randn(n).astype(np.float32)
+        timeLine = np.linspace(0, n, n)
+        emd = decomposizione.nuovoEMD()
+        IMF_old, EXT_old, ITER_old, n_old = _emd_originale(emd, S, timeLine)
+        IMF_new, EXT_new, ITER_new, n_new = emd.emd(S, timeLine, -1)
+        assert n_old == n_new
+        for i in range(n_new):
+            # same up to the rounding of the envelopes (see bench_inviluppi)
+            assert np.allclose(IMF_old[i], IMF_new[i], rtol=0, atol=1e-9 * np.abs(S).max())
+            assert EXT_old[i] == EXT_new[i] and ITER_old[i] == ITER_new[i]
+        rip = 1 if n > 1024 else 5
+        riga('emd', n, misura(_emd_originale, emd, S, timeLine, ripetizioni=rip),
+             misura(emd.emd, S, timeLine, -1, ripetizioni=rip))
+
+
+###################################################
+## inviluppi
+
+def bench_inviluppi():
+    """Both envelopes of one sifting iteration: interp1d/EMD.akima against Inviluppi."""
+    for n in (100, 1024, 16384):
+        S = imf_di_prova(n)[0] - imf_di_prova(n)[0].mean()
+        T = np.linspace(0, n, n)
+        emd = decomposizione.nuovoEMD()
+        emd.DTYPE = np.float64
+        indmax, indmin, indzer = emd._extremaIndices(S)
+        maxExtrema, minExtrema = emd._mirrorPoints(T, S, indmax, indmin)
+        inv = inviluppi.Inviluppi(T)
+        for kind in ('cubic', 'akima'):
+
+            def vecchio():
+                return (emd.splinePoints(T, maxExtrema, kind)[1],
+                        emd.splinePoints(T, minExtrema, kind)[1])
+
+            def nuovo():
+                return inv.valuta(maxExtrema, minExtrema, kind, emd.DTYPE)
+
+            old, new = vecchio(), nuovo()
+            assert np.allclose(old, new, rtol=0, atol=1e-9 * np.abs(S).max())
+            riga('inv(%s)' % kind, n, misura(vecchio), misura(nuovo))
+
+
+###################################################
+## decomposizione backends
+
+def bench_decomposizione():
+    """CPU time per window of every backend (nothing to compare against)."""
+    rng = np.random.RandomState(0)
+    for n in (100, 1024):
+        S = rng.randn(n).astype(np.float32)
+        # 'streaming' is fed the windows of a stream sliding by 5 samples
+        flusso = rng.randn(n + 5 * 20).astype(np.float32)
+        timeLine = np.linspace(0, n, n)
+        for nome in sorted(decomposizione.BACKENDS):
+            backend = decomposizione.crea(nome)
+            for i in range(3 if nome == 'eemd' else 20):
+                if nome == 'streaming':
+                    backend.imf(flusso[5 * i:5 * i + n], timeLine, ('bench', 5 * i + n))
+                else:
+                    backend.imf(S, timeLine)
+            stat = backend.statistiche()
+            print("%-12s n=%-7d %-8s cpu: %10.3f ms/finestra"
+                  % ('decomp', n, nome, stat['cpu_ms_finestra']))
+
+
+###################################################
+## spettro
+
+def _compute_fft_originale(vibsig, tstep):
+    v_sp = np.fft.fft(vibsig)/len(vibsig)
+    v_ps = np.abs(v_sp)**2
+    v_freqs = np.fft.fftfreq(len(vibsig), tstep)
+    v_idx = np.argsort(v_freqs)
+    fidx = np.argmax(v_ps)
+    f_freq = abs(v_freqs[fidx])
+    return v_freqs[v_idx], v_ps[v_idx], f_freq
+
+
+def _aree_originali(segnali):
+    """Spectral areas of calcoloAree: a full complex FFT per signal."""
+    from scipy.fftpack import fft
+    return np.trapz(np.abs(fft(segnali, axis=-1))**2, axis=-1)
+
+
+def bench_spettro():
+    rng = np.random.RandomState(0)
+    for n in (100, 1024, 16384):
+        # 64 components x 3 axes
+        X = rng.randn(64, 3, n)
+        vecchi = [_compute_fft_originale(x, 0.02) for x in X.reshape(-1, n)]
+        freqs, ps, fondamentali = utils.compute_fft(X, 0.02)
+        for (f, p, ff), q, fq in zip(vecchi, ps.reshape(-1, n), fondamentali.ravel()):
+            assert np.array_equal(f, freqs) and ff == fq
+            assert np.allclose(p, q, rtol=1e-9, atol=1e-12 * p.max())
+        riga('compute_fft', X.size,
+             misura(lambda: [_compute_fft_originale(x, 0.02) for x in X.reshape(-1, n)]),
+             misura(utils.compute_fft, X, 0.02))
+
+        S = X.reshape(-1, n).astype(np.float32)
+        nuove = spettro.area(spettro.potenza(S, normalizza=False), n)
+        assert np.allclose(_aree_originali(S), nuove, rtol=1e-5)
+        riga('aree', S.size, misura(_aree_originali, S),
+             misura(lambda: spettro.area(spettro.potenza(S, normalizza=False), n)))
+
+
+###################################################
+## calcoloArea.calcoloFeaturesSensore
+
+def bench_sensore():
+    """Three calcoloFeatures against one calcoloFeaturesSensore, 'emd'."""
+    import calcoloArea
+    rng = np.random.RandomState(0)
+    finestre = rng.randn(20, 3, 100).astype(np.float32)
+    for w in finestre:
+        assert np.allclose([f for x in w for f in calcoloArea.calcoloFeatures(x)],
+                           calcoloArea.calcoloFeaturesSensore(w), rtol=1e-4, atol=1e-9)
+    backend = decomposizione.crea('emd')
+    timeLine = np.linspace(0, 100, 100)
+    t_emd = misura(lambda: [backend.imfCanali(w, timeLine) for w in finestre], ripetizioni=3)
+    t_old = misura(lambda: [[calcoloArea.calcoloFeatures(x) for x in w] for w in finestre],
+                   ripetizioni=3)
+    t_new = misura(lambda: [calcoloArea.calcoloFeaturesSensore(w) for w in finestre],
+                   ripetizioni=3)
+    riga('sensore', 100, t_old / len(finestre), t_new / len(finestre))
+    # the EMD of the axes is not shared: it bounds the gain
+    print("%-12s n=%-7d emd dei tre assi: %10.3f ms"
+          % ('sensore', 100, t_emd / len(finestre) * 1e3))
+
+
+###################################################
+## emd_streaming
+
+def bench_streaming():
+    """A full EMD of every window against the sliding update, hop=5."""
+    hop, aggiornamenti = 5, 20
+    for n, guardia in ((100, 20), (1024, 40)):
+        x = imf_di_prova(n + hop * aggiornamenti)[0].astype(np.float32)
+        timeLine = np.linspace(0, n, n)
+        emd = decomposizione.nuovoEMD()
+        finestre = [x[i:i + n] for i in range(hop, hop * (aggiornamenti + 1), hop)]
+
+        def completa():
+            for w in finestre:
+                emd.emd(w, timeLine, -1)
+
+        def streaming():
+            s = EMDStreaming(n, hop, guardia)
+            s.inizializza(x[:n])
+            for i, w in enumerate(finestre):
+                IMF = s.aggiorna(x[n + i * hop:n + (i + 1) * hop])
+                # the stitched IMFs still add up to the window
+                assert np.allclose(IMF.sum(axis=0), w, atol=1e-4 * np.abs(w).max())
+
+        t_old = misura(completa, ripetizioni=3) / aggiornamenti
+        t_new = misura(streaming, ripetizioni=3) / aggiornamenti
+        riga('streaming', n, t_old, t_new)
+
+
+###################################################
+## wire
+
+def bench_wire():
+    """JSON against the float32 frames of wire.py, for the windows of n fans."""
+    rng = np.random.RandomState(0)
+    for fans in (1, 16, 256):
+        finestre = [{"nome": "Ventola-%d" % i, "settore": "k", "cursore": i,
+                     "statoAttuale": "buono", "datiX": rng.randn(200) * 1e3,
+                     "datiY": rng.randn(200) * 1e3, "datiZ": rng.randn(200) * 1e3}
+                    for i in range(fans)]
+
+        def json_():
+            return json.dumps([dict(f, datiX=f["datiX"].tolist(), datiY=f["datiY"].tolist(),
+                                    datiZ=f["datiZ"].tolist()) for f in finestre])
+
+        for f, (h, X, Y, Z) in zip(finestre, wire.decode(wire.encode(finestre))):
+            assert h["nome"] == f["nome"] and np.array_equal(X, f["datiX"].astype(np.float32))
+        riga('wire', fans * 600, misura(json_), misura(wire.encode, finestre))
+        print("%-12s n=%-7d json: %10d B  binario: %8d B"
+              % ('wire', fans * 600, len(json_()), len(wire.encode(finestre))))
+
+
+BENCHMARKS = {
+    'decomposizione': bench_decomposizione,
+    'detect_peaks': bench_detect_peaks,
+    'emd': bench_emd,
+    'inviluppi': bench_inviluppi,
+    'mhs': bench_mhs,
+    'sensore': bench_sensore,
+    'spettro': bench_spettro,
+    'streaming': bench_streaming,
+    'wire': bench_wire,
+}
+
+if __name__ == "__main__":
+    nomi = sys.argv[1:] or sorted(BENCHMARKS)
+    for nome in nomi:
+        BENCHMARKS[nome]()
@@ -0,0 +1,101 @@
+"""
+Bearing geometry of the components, and the tables the features of a
+bearing are computed with.
+
+The features look at the characteristic frequencies of the bearing of a
+fan: outer race (f_or), inner race (f_ir) and ball (f_b), which depend
+on its geometry and speed. Componente stores them per fan (schema
+version 3); a component whose geometry is not set uses
+calcoloArea.CUSCINETTO, the fan the classifier was trained on.
+
+Everything derived from a geometry is held by a Configurazione:
+
+    frequenze   (f_or, f_ir, f_b), in Hz
+    sos         the Butterworth low-pass filters at f_or, f_ir and f_b,
+                as second-order sections, shape (3, sections, 6)
+
+configurazione() designs it on the first request only, so a new fan
+type costs one filter design per process.
+
+A geometry whose characteristic frequencies are not below half the
+sample rate cannot be filtered: daRiga(valori, fs) discards it (with a
+warning) so that the component keeps the default bearing instead of
+failing on every window.
+"""
+from collections import namedtuple
+import logging
+
+import numpy as np
+from scipy.signal import butter
+
+from schema import COLONNE_CUSCINETTO as COLONNE
+
+# angolo: contact angle, in radians
+Cuscinetto = namedtuple('Cuscinetto', 'sfere rpm diametroSfere diametroPrimitivo angolo')
+
+_configurazioni = {}
+
+
+def daRiga(valori, fs=None, nome=None):
+    """
+    Cuscinetto from the COLONNE of a Componente row, None if any is NULL.
+    fs: sample rate the bearing is used at; a geometry which is not
+        valido() at it is logged and discarded (None) too
+    nome: component of the row, for the log
+    """
+    if any(v is None for v in valori):
+        return None
+    cuscinetto = Cuscinetto(*valori)
+    if fs is not None and not valido(cuscinetto, fs):
+        logging.getLogger('CUSCINETTO').warning(
+            "bearing %s of %s has characteristic frequencies %s Hz not in (0, %g) Hz: "
+            "using the default one", cuscinetto, nome, frequenzeCaratteristiche(cuscinetto), 0.5*fs)
+        return None
+    return cuscinetto
+
+
+def frequenzeCaratteristiche(cuscinetto):
+    """Returns (f_or, f_ir, f_b) in Hz."""
+    c = cuscinetto
+    fr = c.rpm/60.0
+    f_or = c.sfere/2 * fr * (1 - c.diametroSfere/c.diametroPrimitivo * np.cos(c.angolo))
+    f_ir = c.sfere/2 * fr * (1 + c.diametroSfere/c.diametroPrimitivo * np.cos(c.angolo))
+    f_b = c.diametroPrimitivo/c.diametroSfere * fr * (1 - (c.diametroSfere/c.diametroPrimitivo * np.cos(c.angolo))**2)
+    return f_or, f_ir, f_b
+
+
+def valido(cuscinetto, fs):
+    """True if the characteristic frequencies are in (0, fs/2)."""
+    try:
+        return all(0 < f < 0.5*fs for f in frequenzeCaratteristiche(cuscinetto))
+    except (TypeError, ZeroDivisionError):
+        return False
+
+
+class Configurazione:
+    """
+    cuscinetto: Cuscinetto
+    fs: sample rate, in Hz
+    ordine: order of the low-pass filters
+    """
+
+    def __init__(self, cuscinetto, fs, ordine):
+        self.cuscinetto = cuscinetto
+        self.fs = fs
+        self.ordine = ordine
+        self.frequenze = frequenzeCaratteristiche(cuscinetto)
+        nyq = 0.5*fs
+        for f in self.frequenze:
+            if not 0 < f < nyq:
+                raise ValueError("characteristic frequency %.3f Hz of %s is not in (0, %g) Hz"
+                                 % (f, cuscinetto, nyq))
+        self.sos = np.stack([butter(ordine, f/nyq, btype='low', output='sos')
+                             for f in self.frequenze])
+
+
+def configurazione(cuscinetto, fs, ordine):
+    """The Configurazione of (cuscinetto, fs, ordine), designed once."""
+    key = (tuple(cuscinetto), fs, ordine)
+    if key not in _configurazioni:
+        _configurazioni[key] = Configurazione(Cuscinetto(*cuscinetto), fs, ordine)
+    return _configurazioni[key]
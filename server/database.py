@@ -0,0 +1,140 @@
+"""
+Data access layer of server.py.
+
+A small pool of persistent sqlite connections, opened read-only through
+a file: URI, serves the API queries. The database is switched to WAL mode
+so that these readers never block (nor are blocked by) provaMosquito.py
+committing new samples. Queries are plain parameterized statements, which
+sqlite keeps prepared in each connection's statement cache, and they run
+on a thread pool so that slow disk I/O never stalls the IOLoop.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import os
+from queue import Queue
+import sqlite3
+from urllib.request import pathname2url
+
+import tornado.ioloop
+
+import cuscinetto
+import schema
+
+SQL_COMPONENTI = "SELECT Nome, Sezione FROM Componente"
+SQL_SEZIONE = "SELECT Sezione FROM Componente WHERE Nome=?"
+SQL_CUSCINETTI = "SELECT Nome, %s FROM Componente" % ", ".join(cuscinetto.COLONNE)
+SQL_CUSCINETTO = "SELECT %s FROM Componente WHERE Nome=?" % ", ".join(cuscinetto.COLONNE)
+SQL_ULTIMI_CAMPIONI = ("SELECT ID_Coordinate, X, Y, Z FROM Coordinate "
+                       "WHERE Nome_Componente=? ORDER BY ID_Coordinate DESC LIMIT ?")
+SQL_PRIMI_CAMPIONI = ("SELECT X, Y, Z FROM Coordinate "
+                      "WHERE Nome_Componente=? ORDER BY ID_Coordinate LIMIT ?")
+# %s: Coordinate or one of its daily partitions
+SQL_CAMPIONI_INTERVALLO = ("SELECT ID_Coordinate, X, Y, Z, Timestamp FROM `%s` "
+                           "WHERE Nome_Componente=? AND Timestamp BETWEEN ? AND ? "
+                           "ORDER BY Timestamp LIMIT ?")
+# %s: Rollup_Minuto or Rollup_Ora
+SQL_ROLLUP = ("SELECT Inizio, " + ", ".join(schema.COLONNE_ROLLUP) + " FROM `%s` "
+              "WHERE Nome_Componente=? AND Inizio BETWEEN ? AND ? ORDER BY Inizio")
+SQL_NUOVI_CAMPIONI = ("SELECT ID_Coordinate, X, Y, Z, Nome_Componente FROM Coordinate "
+                      "WHERE ID_Coordinate>? ORDER BY ID_Coordinate")
+
+
+def enable_wal(path):
+    """Switches the database to write-ahead logging (persistent)."""
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+    finally:
+        conn.close()
+
+
+class Database:
+    """
+    path: sqlite database file
+    size: number of pooled connections, and of threads running queries
+    readonly: open the connections with mode=ro
+    """
+
+    def __init__(self, path, size=4, readonly=True):
+        self.path = path
+        self.size = size
+        enable_wal(path)
+        if readonly:
+            uri = 'file:%s?mode=ro' % pathname2url(os.path.abspath(path))
+        else:
+            uri = 'file:%s' % pathname2url(os.path.abspath(path))
+        self.__pool = Queue()
+        for _ in range(size):
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False,
+                                   cached_statements=64)
+            self.__pool.put(conn)
+        self.executor = ThreadPoolExecutor(max_workers=size)
+
+    @contextmanager
+    def connection(self):
+        """Borrows a connection from the pool (blocks if all are busy)."""
+        conn = self.__pool.get()
+        try:
+            yield conn
+        finally:
+            self.__pool.put(conn)
+
+    def fetchall(self, sql, params=()):
+        with self.connection() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def fetchone(self, sql, params=()):
+        with self.connection() as conn:
+            return conn.execute(sql, params).fetchone()
+
+    def campioni_intervallo(self, nome, t0, t1, limite=None):
+        """
+        Returns the samples of component nome with t0 <= Timestamp <= t1
+        as rows (ID_Coordinate, X, Y, Z, Timestamp), oldest first.
+        Samples stored before schema version 1 have no timestamp.
+        limite: at most this many rows are read and returned (None: all)
+
+        Only Coordinate and the daily partitions overlapping [t0, t1]
+        are read; days dropped by retention.py are gone, use rollup()
+        for long ranges.
+        """
+        with self.connection() as conn:
+            tabelle = [tabella for giorno, tabella in sorted(schema.partizioni(conn).items())
+                       if giorno * 86400 <= t1 and (giorno + 1) * 86400 > t0]
+            righe = []
+            for tabella in tabelle + ['Coordinate']:
+                resto = -1 if limite is None else limite - len(righe)
+                if resto == 0:
+                    break
+                righe.extend(conn.execute(SQL_CAMPIONI_INTERVALLO % tabella, (nome, t0, t1, resto)))
+        if tabelle:
+            righe.sort(key=lambda r: r[4])
+        return righe
+
+    def cuscinetti(self, fs=None):
+        """
+        Returns {component: cuscinetto.Cuscinetto}, None for the components
+        whose bearing is not set (they use calcoloArea.CUSCINETTO), or not
+        valid at sample rate fs if given (see cuscinetto.daRiga).
+        """
+        return dict((r[0], cuscinetto.daRiga(r[1:], fs, r[0])) for r in self.fetchall(SQL_CUSCINETTI))
+
+    def rollup(self, nome, t0, t1, risoluzione='ora'):
+        """
+        Returns the rollups ('minuto' or 'ora') of component nome starting
+        between t0 and t1, as rows (Inizio, *schema.COLONNE_ROLLUP).
+        """
+        tabella, _ = schema.TABELLE_ROLLUP[risoluzione]
+        return self.fetchall(SQL_ROLLUP % tabella, (nome, t0, t1))
+
+    def run(self, fn, *args):
+        """
+        Runs fn(*args), which may query the database, on the query
+        threads. Returns a future to be awaited from the IOLoop.
+        """
+        return tornado.ioloop.IOLoop.current().run_in_executor(self.executor, fn, *args)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        for _ in range(self.size):
+            self.__pool.get().close()
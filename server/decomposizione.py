@@ -0,0 +1,304 @@
+"""
+Decomposition backends of the IMF/Hilbert stage of the features (see
+calcoloArea.calcoloMassimiMHS): each one turns a window into a set of
+(pseudo) IMFs, trading accuracy against CPU time.
+
+    'emd'     EMD_main.EMD with FIXE_H=3 and cubic splines: the features
+              the classifier was trained on (default)
+    'eemd'    EEMD.EEMD, seeded and with complementary noise trials: more
+              robust on noisy signals, `trials` times the cost of 'emd'
+    'emd-stacked'  'emd' sifting the axes of a sensor together, so that
+              their IMFs are aligned (see EMD.emdStacked)
+    'filtri'  bank of Butterworth low-pass filters at octave spaced
+              cut-offs, the pseudo-IMFs being the differences between
+              adjacent bands: microseconds per window, for screening
+    'streaming'  'emd' over sliding windows (see emd_streaming.py): a
+              window that continues the previous one of its stream only
+              costs the decomposition of its new samples and guard
+              bands: barely cheaper than 'emd' on 100 samples windows,
+              2-3x on 1024. It always returns numImf IMFs, so its
+              features differ from 'emd'
+
+    dec = crea('filtri')
+    IMF = dec.imf(segnale, timeLine)
+    dec.statistiche()   # windows decomposed and CPU time per window
+
+The counters of an instance only see its own process: the feature_pool
+tasks return the cost of their decompositions, which server.py sums
+in a Costi and serves at /backendStats.
+
+A backend is picked per deployment (calcoloArea.DECOMPOSIZIONE) or per
+call (the decomposizione argument of the calcoloArea functions). New
+backends subclass Decomposizione and are registered with @registra.
+"""
+from collections import OrderedDict
+import time
+
+import numpy as np
+from scipy.signal import butter, sosfilt
+
+from EMD_main import EMD
+from EEMD import EEMD
+from emd_streaming import EMDStreaming
+
+BACKENDS = {}
+
+
+def registra(nome):
+    """Class decorator adding a backend to BACKENDS under nome."""
+    def decoratore(cls):
+        cls.nome = nome
+        BACKENDS[nome] = cls
+        return cls
+    return decoratore
+
+
+def crea(nome, **opzioni):
+    """Returns a new instance of the backend registered as nome."""
+    if nome not in BACKENDS:
+        raise ValueError("unknown decomposition backend %r (available: %s)"
+                         % (nome, ", ".join(sorted(BACKENDS))))
+    return BACKENDS[nome](**opzioni)
+
+
+class Decomposizione:
+    """
+    Base class of the backends: subclasses implement _imf(). imf() also
+    measures the CPU time (time.process_time, i.e. of this process only)
+    spent on every window.
+
+    multicanale: imfCanali() decomposes the channels together, so they
+                 cannot be split across processes
+    """
+    nome = None
+    multicanale = False
+
+    def __init__(self):
+        self.finestre = 0
+        self.cpu = 0.0          # seconds, over all the windows
+        self.cpu_ultima = 0.0   # seconds, last window
+
+    def _imf(self, segnale, timeLine):
+        raise NotImplementedError
+
+    def _imfFlusso(self, segnale, timeLine, flusso):
+        # only the streaming backend makes use of flusso
+        return self._imf(segnale, timeLine)
+
+    def _imfCanali(self, segnali, timeLine, flusso=None):
+        return [self._imfFlusso(s, timeLine, canale(flusso, c)) for c, s in enumerate(segnali)]
+
+    def _misura(self, fn, finestre, *args):
+        t0 = time.process_time()
+        risultato = fn(*args)
+        self.cpu_ultima = (time.process_time() - t0) / finestre
+        self.cpu += self.cpu_ultima * finestre
+        self.finestre += finestre
+        return risultato
+
+    def imf(self, segnale, timeLine, flusso=None):
+        """
+        Returns the IMFs of segnale as rows of a 2D array.
+        flusso: (key, seq) of the stream of samples the window is the
+                tail of, seq being the number of samples of the stream up
+                to the last one of the window (e.g. (component,
+                RingBuffer.count)); only used by 'streaming'
+        """
+        return self._misura(self._imfFlusso, 1, segnale, timeLine, flusso)
+
+    def imfCanali(self, segnali, timeLine, flusso=None):
+        """
+        IMFs of the channels (rows) of segnali, sampled on the same
+        timeLine (e.g. the three axes of a sensor): a list with a 2D
+        array per channel. Every channel counts as a window.
+        flusso: see imf(); channel c is the stream (key, c)
+        """
+        return self._misura(self._imfCanali, len(segnali), segnali, timeLine, flusso)
+
+    def statistiche(self):
+        return {
+            'backend': self.nome,
+            'finestre': self.finestre,
+            'cpu_ms_finestra': self.cpu / self.finestre * 1e3 if self.finestre else 0.0,
+            'cpu_ms_ultima': self.cpu_ultima * 1e3,
+        }
+
+
+class Costi:
+    """
+    CPU time of decompositions run in other processes, summed per backend
+    from the costs (backend name, windows, CPU seconds) the tasks return.
+    """
+
+    def __init__(self):
+        self.__backend = {}  # nome -> [finestre, cpu, cpu_ultima]
+
+    def aggiungi(self, costo):
+        nome, finestre, cpu = costo
+        if finestre == 0:
+            return
+        voce = self.__backend.setdefault(nome, [0, 0.0, 0.0])
+        voce[0] += finestre
+        voce[1] += cpu
+        voce[2] = cpu / finestre
+
+    def statistiche(self):
+        """As Decomposizione.statistiche(), one entry per backend."""
+        return [{
+            'backend': nome,
+            'finestre': finestre,
+            'cpu_ms_finestra': cpu / finestre * 1e3,
+            'cpu_ms_ultima': ultima * 1e3,
+        } for nome, (finestre, cpu, ultima) in sorted(self.__backend.items())]
+
+
+def canale(flusso, c):
+    """The flusso of channel c of a multichannel stream."""
+    if flusso is None:
+        return None
+    chiave, seq = flusso
+    return (chiave, c), seq
+
+
+def nuovoEMD():
+    """The EMD configuration the features are computed with."""
+    emd = EMD()
+    emd.FIXE_H = 3
+    emd.nbsym = 2
+    emd.splineKind = 'cubic'
+    return emd
+
+
+@registra('emd')
+class DecomposizioneEMD(Decomposizione):
+    """
+    stacked: the channels of imfCanali() are sifted together (see
+             EMD.emdStacked) and get the same number of IMFs
+    """
+
+    def __init__(self, stacked=False):
+        Decomposizione.__init__(self)
+        self.emd = nuovoEMD()
+        self.stacked = stacked
+
+    def _imf(self, segnale, timeLine):
+        IMF, EXT, ITER, imfNo = self.emd.emd(segnale, timeLine, -1)
+        return IMF
+
+    def _imfCanali(self, segnali, timeLine, flusso=None):
+        if not self.stacked:
+            return Decomposizione._imfCanali(self, segnali, timeLine, flusso)
+        IMF, EXT, ITER, imfNo = self.emd.emdStacked(segnali, timeLine, -1)
+        return list(IMF)
+
+
+@registra('emd-stacked')
+class DecomposizioneEMDStacked(DecomposizioneEMD):
+    multicanale = True
+
+    def __init__(self):
+        DecomposizioneEMD.__init__(self, stacked=True)
+
+
+@registra('eemd')
+class DecomposizioneEEMD(Decomposizione):
+    """
+    trials, noiseWidth, seed: see EEMD.EEMD (complementary trials)
+    executor: pool the trials run on (their CPU time is not counted)
+    """
+
+    def __init__(self, trials=20, noiseWidth=0.3, seed=0, executor=None):
+        Decomposizione.__init__(self)
+        self.eemd = EEMD()
+        self.eemd.EMD = nuovoEMD()
+        self.eemd.trials = trials
+        self.eemd.noiseWidth = noiseWidth
+        self.eemd.seed = seed
+        self.eemd.complementary = True
+        self.executor = executor
+
+    def _imf(self, segnale, timeLine):
+        IMF, EXT, ITER, imfNo = self.eemd.eemd(segnale, timeLine, -1, executor=self.executor)
+        return IMF
+
+
+_bancaFiltri = {}
+
+
+@registra('filtri')
+class DecomposizioneFiltri(Decomposizione):
+    """
+    bande: number of pseudo-IMFs before the residual; band k (from 0)
+           spans [fs/2**(k+2), fs/2**(k+1)]
+    ordine: order of the Butterworth filters
+    """
+
+    def __init__(self, bande=4, ordine=4):
+        Decomposizione.__init__(self)
+        key = (bande, ordine)
+        if key not in _bancaFiltri:
+            _bancaFiltri[key] = [butter(ordine, 0.5 ** (k + 1), btype='low', output='sos')
+                                 for k in range(bande)]
+        self.sos = _bancaFiltri[key]
+
+    def _imf(self, segnale, timeLine):
+        segnale = np.asarray(segnale, dtype=np.float64)
+        IMF = np.empty((len(self.sos) + 1, len(segnale)))
+        precedente = segnale
+        for k, sos in enumerate(self.sos):
+            passabasso = sosfilt(sos, segnale)
+            np.subtract(precedente, passabasso, out=IMF[k])
+            precedente = passabasso
+        IMF[-1] = precedente
+        return IMF
+
+
+@registra('streaming')
+class DecomposizioneStreaming(Decomposizione):
+    """
+    Keeps an EMDStreaming per stream, identified by the flusso (key, seq)
+    of the windows (see Decomposizione.imf). A window h samples after the
+    previous one of its stream only updates the IMFs of the stream with
+    its last h samples: no samples are compared. Any other window (no
+    flusso, a stream not seen by this instance, or one too far behind)
+    is decomposed from scratch and starts the stream. In a process pool
+    every worker keeps its own streams, so a window only continues its
+    stream if the same worker decomposed the previous one.
+    flussi: number of streams kept, the least recently used are dropped
+    guardia, numImf: see EMDStreaming
+    """
+
+    def __init__(self, guardia=20, numImf=4, flussi=64):
+        Decomposizione.__init__(self)
+        self.guardia = guardia
+        self.numImf = numImf
+        self.maxFlussi = flussi
+        self.flussi = OrderedDict()  # key -> [EMDStreaming, seq]
+
+    def _nuovo(self, segnale):
+        return EMDStreaming(finestra=len(segnale), hop=1,
+                            guardia=min(self.guardia, (len(segnale) - 1) // 2),
+                            numImf=self.numImf)
+
+    def _imf(self, segnale, timeLine):
+        return self._nuovo(segnale).inizializza(segnale)
+
+    def _imfFlusso(self, segnale, timeLine, flusso):
+        if flusso is None:
+            return self._imf(segnale, timeLine)
+        chiave, seq = flusso
+        segnale = np.asarray(segnale)
+        voce = self.flussi.get(chiave)
+        if voce is not None:
+            stream, precedente = voce
+            h = seq - precedente
+            if stream.finestra == len(segnale) and 0 <= h <= stream.finestra - 2 * stream.guardia:
+                self.flussi.move_to_end(chiave)
+                voce[1] = seq
+                return stream.aggiorna(segnale[len(segnale) - h:], forza=True)
+        stream = self._nuovo(segnale)
+        self.flussi[chiave] = [stream, seq]
+        self.flussi.move_to_end(chiave)
+        if len(self.flussi) > self.maxFlussi:
+            self.flussi.popitem(last=False)
+        return stream.inizializza(segnale)
@@ -89,50 +89,12 @@ def detect_peaks(x, mph=None, mpd=1, threshold=0, edge='rising',
         return np.array([], dtype=int)
     if valley:
         x = -x
-    # find indexes of all peaks
-    dx = x[1:] - x[:-1]
-    # handle NaN's
     indnan = np.where(np.isnan(x))[0]
-    if indnan.size:
-        x[indnan] = np.inf
-        dx[np.where(np.isnan(dx))[0]] = np.inf
-    ine, ire, ife = np.array([[], [], []], dtype=int)
-    if not edge:
-        ine = np.where((np.hstack((dx, 0)) < 0) & (np.hstack((0, dx)) > 0))[0]
-    else:
-        if edge.lower() in ['rising', 'both']:
-            ire = np.where((np.hstack((dx, 0)) <= 0) & (np.hstack((0, dx)) > 0))[0]
-        if edge.lower() in ['falling', 'both']:
-            ife = np.where((np.hstack((dx, 0)) < 0) & (np.hstack((0, dx)) >= 0))[0]
-    ind = np.unique(np.hstack((ine, ire, ife)))
-    # handle NaN's
-    if ind.size and indnan.size:
-        # NaN's and values close to NaN's cannot be peaks
-        ind = ind[np.in1d(ind, np.unique(np.hstack((indnan, indnan-1, indnan+1))), invert=True)]
-    # first and last values of x cannot be peaks
-    if ind.size and ind[0] == 0:
-        ind = ind[1:]
-    if ind.size and ind[-1] == x.size-1:
-        ind = ind[:-1]
-    # remove peaks < minimum peak height
-    if ind.size and mph is not None:
-        ind = ind[x[ind] >= mph]
-    # remove peaks - neighbors < threshold
-    if ind.size and threshold > 0:
-        dx = np.min(np.vstack([x[ind]-x[ind-1], x[ind]-x[ind+1]]), axis=0)
-        ind = np.delete(ind, np.where(dx < threshold)[0])
+    peaks = _candidates(x[np.newaxis], mph, threshold, edge)
+    ind = np.nonzero(peaks[0])[0]
     # detect small peaks closer than minimum peak distance
     if ind.size and mpd > 1:
-        ind = ind[np.argsort(x[ind])][::-1]  # sort ind by peak height
-        idel = np.zeros(ind.size, dtype=bool)
-        for i in range(ind.size):
-            if not idel[i]:
-                # keep peaks with the same height if kpsh is True
-                idel = idel | (ind >= ind[i] - mpd) & (ind <= ind[i] + mpd) \
-                    & (x[ind[i]] > x[ind] if kpsh else True)
-                idel[i] = 0  # Keep current peak
-        # remove the small peaks and sort back the indexes by their occurrence
-        ind = np.sort(ind[~idel])
+        ind = _suppress(x, ind, mpd, kpsh)
 
     if show:
         if indnan.size:
@@ -143,6 +105,109 @@ def detect_peaks(x, mph=None, mpd=1, threshold=0, edge='rising',
 
     return ind
 
+def detect_peaks_batch(X, mph=None, mpd=1, threshold=0, edge='rising',
+                       kpsh=False, valley=False):
+    """Detect peaks in every row of a 2D array (e.g. many spectra).
+
+    Same parameters as `detect_peaks`, except that mph can also be a
+    sequence with the minimum peak height of every row; returns a list
+    with the indices of the peaks of every row, each one equal to
+    `detect_peaks(X[i], mph[i], ...)`. The candidate peaks of all the rows
+    are found in one vectorized pass.
+    """
+
+    X = np.array(X, dtype='float64', ndmin=2)
+    if X.shape[1] < 3:
+        return [np.array([], dtype=int) for _ in range(X.shape[0])]
+    if np.ndim(mph):
+        mph = np.asarray(mph, dtype='float64').reshape(-1, 1)
+    if valley:
+        X = -X
+    peaks = _candidates(X, mph, threshold, edge)
+    rows = np.split(np.nonzero(peaks)[1], np.cumsum(peaks.sum(axis=1))[:-1])
+    if mpd > 1:
+        rows = [_suppress(x, ind, mpd, kpsh) if ind.size else ind
+                for x, ind in zip(X, rows)]
+    return rows
+
+def _candidates(x, mph, threshold, edge):
+    """Mask of the peaks of the rows of x before the `mpd` suppression.
+
+    The NaN's of x are replaced in place by inf, as in detect_peaks.
+    """
+    # find indexes of all peaks
+    dx = x[:, 1:] - x[:, :-1]
+    # handle NaN's
+    nan = np.isnan(x)
+    rowsnan = nan.any(axis=1)
+    if rowsnan.any():
+        x[nan] = np.inf
+        dx[np.isnan(dx) & rowsnan[:, np.newaxis]] = np.inf
+    zero = np.zeros((x.shape[0], 1))
+    right = np.hstack((dx, zero))
+    left = np.hstack((zero, dx))
+    if not edge:
+        peaks = (right < 0) & (left > 0)
+    else:
+        peaks = np.zeros(x.shape, dtype=bool)
+        if edge.lower() in ['rising', 'both']:
+            peaks |= (right <= 0) & (left > 0)
+        if edge.lower() in ['falling', 'both']:
+            peaks |= (right < 0) & (left >= 0)
+    # NaN's and values close to NaN's cannot be peaks
+    if rowsnan.any():
+        near = nan.copy()
+        near[:, 1:] |= nan[:, :-1]
+        near[:, :-1] |= nan[:, 1:]
+        peaks &= ~near
+    # first and last values of x cannot be peaks
+    peaks[:, 0] = peaks[:, -1] = False
+    # remove peaks < minimum peak height
+    if mph is not None:
+        peaks &= x >= mph
+    # remove peaks - neighbors < threshold
+    if threshold > 0:
+        with np.errstate(invalid='ignore'):
+            dx = np.minimum(x[:, 1:-1] - x[:, :-2], x[:, 1:-1] - x[:, 2:])
+        peaks[:, 1:-1] &= ~(dx < threshold)
+    return peaks
+
+def _suppress(x, ind, mpd, kpsh):
+    """Remove the peaks ind of x closer than mpd to a higher one.
+
+    The peaks are visited from the highest, in the order of the original
+    algorithm (which also decides between peaks of the same height): a
+    peak is kept unless a peak kept before it lies within mpd, and with
+    kpsh unless that peak is also strictly higher. The positions covered
+    by the kept peaks are marked in a buffer, so every peak costs O(mpd)
+    instead of a pass over all the peaks.
+    """
+    ind = ind[np.argsort(x[ind])][::-1]  # sort ind by peak height
+    mpd = int(mpd)
+    span = 2 * mpd + 1
+    covered = bytearray(x.size + span)  # position p is at p + mpd
+    mark = b'\x01' * span
+    kept = []
+    if not kpsh:
+        for p in ind.tolist():
+            if not covered[p + mpd]:
+                kept.append(p)
+                covered[p:p + span] = mark
+    else:
+        # peaks with the same height are adjacent in ind: they only
+        # cover their neighbors once the whole group has been visited
+        group, height = [], None
+        for p, h in zip(ind.tolist(), x[ind].tolist()):
+            if h != height:
+                for q in group:
+                    covered[q:q + span] = mark
+                group, height = [], h
+            if not covered[p + mpd]:
+                kept.append(p)
+                group.append(p)
+    # sort back the indexes by their occurrence
+    return np.sort(np.array(kept, dtype=ind.dtype))
+
 def _plot(x, mph, mpd, threshold, edge, valley, ax, ind):
     """Plot results of the detect_peaks function, see its help."""
     try:
@@ -0,0 +1,120 @@
+"""
+Sliding-window EMD of a stream of samples.
+
+Consecutive dashboard windows overlap in all but a few samples, but
+decomposing every window from scratch costs as much as the whole window.
+EMDStreaming keeps the IMFs of the current window. When new samples
+arrive, the window slides by them and only a short segment at its end is
+decomposed again: the new samples, preceded and followed by a guard band
+of `guardia` samples.
+
+    |<----------------- finestra ----------------->|
+    |   IMFs kept from the previous window  | g | new + g |
+                                            |<- segment ->|
+
+The left guard band absorbs the end effects of the segment's
+decomposition and is thrown away. The IMFs of the newest `guardia`
+samples are provisional: there is no signal after them yet, so they are
+decomposed again with the next update. The cost of an update is
+therefore that of an EMD over hop + 2*guardia samples, whatever the
+window length.
+
+The segment is not much shorter than a dashboard window, though: with
+finestra=100, hop=5 and guardia=20 it is 45 samples, and an EMD has a
+per-call cost that does not shrink with the signal, so an update costs
+about 80% of a full decomposition (1.2x faster; 2-3x at finestra=1024,
+see `python benchmark.py streaming`). The sifting state of the kept
+part of the window (extrema, envelopes) is not reused: the sifting of
+the segment does not depend on it. The streaming backend therefore pays
+off on long windows only, and is never the default.
+
+The IMFs are stitched at the guard band, so they differ from a full EMD
+of the window. They are always `numImf` rows: the IMFs beyond the last
+row are added to it, and missing ones are zero.
+"""
+import numpy as np
+
+
+class EMDStreaming:
+    """
+    finestra: window length, in samples
+    hop: the window slides once at least hop new samples are pending
+    guardia: guard band, in samples, at each side of the new samples
+    numImf: number of IMFs kept
+    emd: EMD_main.EMD instance (the feature configuration if None)
+    """
+
+    def __init__(self, finestra=100, hop=10, guardia=20, numImf=4, emd=None):
+        if hop < 1 or guardia < 0 or hop + 2 * guardia > finestra:
+            raise ValueError("hop + 2*guardia must not exceed finestra")
+        if emd is None:
+            from decomposizione import nuovoEMD
+            emd = nuovoEMD()
+        self.emd = emd
+        self.finestra = finestra
+        self.hop = hop
+        self.guardia = guardia
+        self.numImf = numImf
+
+        self.segnale = None     # current window
+        self.IMF = None         # its IMFs, shape (numImf, finestra)
+        self.__nuovi = []       # samples not in the window yet
+
+        self.aggiornamenti = 0  # incremental updates
+        self.ricalcoli = 0      # full decompositions
+
+    def _decomponi(self, segnale):
+        timeLine = np.linspace(0, len(segnale), len(segnale))
+        IMF, EXT, ITER, imfNo = self.emd.emd(segnale, timeLine, -1)
+        out = np.zeros((self.numImf, len(segnale)), dtype=IMF.dtype)
+        k = min(imfNo, self.numImf)
+        out[:k] = IMF[:k]
+        if imfNo > self.numImf:
+            out[-1] += IMF[self.numImf:].sum(axis=0)
+        return out
+
+    def inizializza(self, segnale):
+        """Decomposes a whole window from scratch; returns its IMFs."""
+        segnale = np.array(segnale)
+        if len(segnale) != self.finestra:
+            raise ValueError("expected a window of %d samples" % self.finestra)
+        self.segnale = segnale
+        self.IMF = self._decomponi(segnale)
+        self.__nuovi = []
+        self.ricalcoli += 1
+        return self.IMF
+
+    def aggiorna(self, campioni, forza=False):
+        """
+        Adds new samples to the stream. The window slides when at least
+        hop samples are pending (or at once with forza=True).
+        Returns the IMFs of the current window (None until the first
+        finestra samples have arrived).
+        """
+        self.__nuovi.extend(campioni)
+        h = len(self.__nuovi)
+        if self.segnale is None:
+            if h >= self.finestra:
+                self.inizializza(self.__nuovi[-self.finestra:])
+            return self.IMF
+        if h == 0 or (h < self.hop and not forza):
+            return self.IMF
+
+        nuovi = np.array(self.__nuovi, dtype=self.segnale.dtype)
+        if h + self.guardia > self.finestra - self.guardia:
+            # too many new samples: no overlap left to keep
+            return self.inizializza(np.concatenate((self.segnale, nuovi))[-self.finestra:])
+
+        N, g = self.finestra, self.guardia
+        segnale = np.concatenate((self.segnale[h:], nuovi))
+        segmento = self._decomponi(segnale[N - h - 2 * g:])
+
+        IMF = np.empty_like(self.IMF)
+        IMF[:, :N - h - g] = self.IMF[:, h:N - g]
+        IMF[:, N - h - g:] = segmento[:, g:]
+
+        self.segnale = segnale
+        self.IMF = IMF
+        self.__nuovi = []
+        self.aggiornamenti += 1
+        return IMF
@@ -0,0 +1,110 @@
+"""
+Process pool running feature extraction and classification for server.py.
+
+The EMD based features take tens of milliseconds per axis: running them on
+the Tornado IOLoop blocks every other request. server.py submits the
+functions below to a concurrent.futures.ProcessPoolExecutor and awaits
+them with IOLoop.run_in_executor: one classifica_sensore task per
+component, or, when there are fewer components than workers, one
+features_asse task per axis followed by predict_confidenza, so that the
+axes of a component run on different cores.
+
+Every worker loads its own copy of the classifier when it starts, and
+keeps one instance per decomposition backend it is asked for (see
+decomposizione.py) and the filters of every bearing it is asked for
+(see cuscinetto.py).
+"""
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from sklearn.externals import joblib
+
+from calcoloArea import calcoloFeatures_batch, calcoloFeaturesSensore, DECOMPOSIZIONE
+import decomposizione as dec
+
+_clf = None
+_decomposizioni = {}
+
+
+def init_worker(model_path):
+    global _clf
+    _clf = joblib.load(model_path)
+
+
+def _decomposizione(nome):
+    nome = nome or DECOMPOSIZIONE
+    if nome not in _decomposizioni:
+        _decomposizioni[nome] = dec.crea(nome)
+    return _decomposizioni[nome]
+
+
+def _misura(backend, fn, *args):
+    """
+    Runs fn(*args); returns its result and the cost of the decompositions
+    of backend it made, as (backend name, windows, CPU seconds): the
+    counters of the backend stay in this worker (see decomposizione.Costi).
+    """
+    finestre, cpu = backend.finestre, backend.cpu
+    risultato = fn(*args)
+    return risultato, (backend.nome, backend.finestre - finestre, backend.cpu - cpu)
+
+
+def features_asse(segnale, decomposizione=None, cuscinetto=None, flusso=None):
+    """
+    Returns (the six features of one axis window, cost), see _misura.
+    decomposizione: backend name, calcoloArea.DECOMPOSIZIONE if None
+    cuscinetto: cuscinetto.Cuscinetto of the component, the default if None
+    flusso: (key, seq) of the window, for the 'streaming' backend (see
+            decomposizione.Decomposizione.imf)
+    """
+    backend = _decomposizione(decomposizione)
+    features, costo = _misura(backend, calcoloFeatures_batch, segnale, False, backend, cuscinetto, flusso)
+    return features[0], costo
+
+
+def classifica_sensore(xyz, decomposizione=None, cuscinetto=None, flusso=None):
+    """
+    Computes the 18 features of one (3, samples) accelerometer window
+    and classifies them, in a single task; returns (label index,
+    confidence, cost), see predict_confidenza and _misura. flusso: see
+    features_asse.
+    """
+    backend = _decomposizione(decomposizione)
+    features, costo = _misura(backend, calcoloFeaturesSensore, xyz, backend, cuscinetto, flusso)
+    return predict_confidenza(features) + (costo,)
+
+
+def predict(features):
+    """Classifies one 18-value feature vector; returns the label index."""
+    return int(_clf.predict([features])[0])
+
+
+def predict_confidenza(features):
+    """
+    Classifies one 18-value feature vector; returns (label index,
+    confidence in [0, 1]). The confidence is the probability of the
+    label if the classifier estimates them, else a logistic of its
+    decision function margin; None if it has neither.
+    """
+    indice = predict(features)
+    if hasattr(_clf, 'predict_proba') and getattr(_clf, 'probability', True):
+        return indice, float(np.max(_clf.predict_proba([features])[0]))
+    if not hasattr(_clf, 'decision_function'):
+        return indice, None
+    d = np.ravel(_clf.decision_function([features]))
+    if len(d) == 1:
+        # two classes: the distance from the separating hyperplane
+        return indice, float(1.0 / (1.0 + np.exp(-abs(d[0]))))
+    e = np.exp(d - d.max())
+    return indice, float(e.max() / e.sum())
+
+
+def create_executor(model_path, max_workers=None):
+    """
+    model_path: classifier loaded by every worker (e.g. net4.pkl)
+    max_workers: number of worker processes, one per core if None
+    """
+    return ProcessPoolExecutor(max_workers=max_workers,
+                               initializer=init_worker,
+                               initargs=(model_path,))
@@ -0,0 +1,91 @@
+"""
+State of the whole fleet, for the plant overview (/fleetState).
+
+StatoFlotta keeps one record per component: its sector, the label and
+confidence of its last classification and when it was computed. The
+records are updated by every classification server.py runs, so
+reading the state of N fans never touches the samples nor the
+classifier: a page costs O(log N + page size), whatever the amount of
+raw data and the size of the fleet.
+
+The records are kept sorted by (sector, name), so that the components
+of a sector are a contiguous range found by bisection.
+"""
+from bisect import bisect_left, insort
+import threading
+
+
+class StatoFlotta:
+    """
+    sconosciuto: label of the components not classified yet, the same as
+                 that of a failed classification
+    """
+
+    def __init__(self, sconosciuto="sconosciuto"):
+        self.sconosciuto = sconosciuto
+        self.__record = {}   # nome -> dict of the record
+        self.__chiavi = []   # sorted (settore, nome)
+        self.__lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.__record)
+
+    def registra(self, nome, settore):
+        """Adds component nome, not classified yet (no-op if known)."""
+        with self.__lock:
+            self._registra(nome, settore)
+
+    def _registra(self, nome, settore):
+        record = self.__record.get(nome)
+        if record is not None:
+            if record["settore"] == settore:
+                return record
+            self.__chiavi.remove((record["settore"], nome))
+            record["settore"] = settore
+        else:
+            record = {"nome": nome, "settore": settore, "stato": self.sconosciuto,
+                      "confidenza": None, "aggiornato": None}
+            self.__record[nome] = record
+        insort(self.__chiavi, (settore, nome))
+        return record
+
+    def aggiorna(self, nome, settore, stato, confidenza, istante):
+        """
+        Records the classification of component nome.
+        stato: label; confidenza: in [0, 1], or None if unknown;
+        istante: epoch seconds of the classification
+        """
+        with self.__lock:
+            record = self._registra(nome, settore)
+            if record["aggiornato"] is not None and istante < record["aggiornato"]:
+                return  # an older result finishing late
+            record.update(stato=stato, confidenza=confidenza, aggiornato=istante)
+
+    def get(self, nome):
+        with self.__lock:
+            record = self.__record.get(nome)
+            return dict(record) if record is not None else None
+
+    def pagina(self, settore=None, offset=0, limite=100):
+        """
+        Returns (totale, righe): the number of components (of sector
+        settore, or of every sector if None) and the records
+        [offset, offset+limite) of them, ordered by sector and name.
+        """
+        with self.__lock:
+            if settore is None:
+                inizio, fine = 0, len(self.__chiavi)
+            else:
+                # settore + "\0" is the smallest string after settore
+                inizio = bisect_left(self.__chiavi, (settore,))
+                fine = bisect_left(self.__chiavi, (settore + "\0",), inizio)
+            chiavi = self.__chiavi[inizio + offset:min(fine, inizio + offset + limite)]
+            return fine - inizio, [dict(self.__record[nome]) for _, nome in chiavi]
+
+    def settori(self):
+        """{sector: number of components}."""
+        with self.__lock:
+            conteggi = {}
+            for settore, _ in self.__chiavi:
+                conteggi[settore] = conteggi.get(settore, 0) + 1
+            return conteggi
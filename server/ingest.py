@@ -0,0 +1,167 @@
+"""
+Batched writer for the accelerometer samples received over MQTT.
+
+provaMosquito.py used to INSERT and commit every sample on its own, i.e.
+one fsync per sample. BatchWriter queues the decoded samples and a
+background thread writes them with executemany in a single transaction
+as soon as batch_size rows are waiting or flush_interval seconds have
+passed since the first of them arrived, whichever comes first.
+
+The queue is bounded: when the disk cannot keep up, put() blocks the
+caller (the MQTT network thread, which in turn slows down the broker)
+for at most put_timeout seconds and then drops the sample. Both events
+are counted in stats().
+
+A transaction that fails (e.g. the database is locked for longer than
+the sqlite timeout) is retried up to max_retries times, waiting
+retry_delay seconds, doubled at every attempt; the rows of a batch that
+still fails are dropped and counted as such.
+"""
+import logging
+from queue import Queue, Empty, Full
+import sqlite3
+import threading
+import time
+
+SQL_INSERT_CAMPIONE = "INSERT INTO Coordinate (X,Y,Z,Nome_Componente,Timestamp) VALUES (?,?,?,?,?)"
+
+
+class BatchWriter:
+    """
+    path: sqlite database file
+    batch_size: rows written per transaction at most
+    flush_interval: seconds a row may wait before being written
+    max_backlog: rows kept in memory at most
+    put_timeout: seconds put() waits for room in a full backlog
+    max_retries: attempts after a failed transaction before its rows
+                 are dropped
+    retry_delay: seconds before the first retry, doubled at every retry
+    stats_interval: seconds between two log lines with the metrics,
+                    None to disable them
+    """
+
+    def __init__(self, path, batch_size=500, flush_interval=0.2,
+                 max_backlog=100000, put_timeout=1.0, max_retries=3,
+                 retry_delay=0.1, stats_interval=60, sql=SQL_INSERT_CAMPIONE):
+        self.__logger = logging.getLogger('INGEST')
+        self.path = path
+        self.sql = sql
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_backlog = max_backlog
+        self.put_timeout = put_timeout
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.stats_interval = stats_interval
+
+        self.__queue = Queue(maxsize=max_backlog)
+        self.__stats_lock = threading.Lock()
+        self.__stats = {
+            'received': 0,      # rows passed to put()
+            'written': 0,       # rows committed
+            'dropped': 0,       # rows discarded: backlog full, or failed retries
+            'blocked': 0,       # put() calls that had to wait for room
+            'flushes': 0,       # committed transactions
+            'errors': 0,        # failed transactions
+            'retries': 0,       # transactions retried after a failure
+            'max_backlog': 0,   # highest backlog seen
+            'last_flush_ms': 0.0,
+        }
+        self.__stop = threading.Event()
+        self.__thread = threading.Thread(target=self._run, name='BatchWriter')
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def put(self, row):
+        """Queues one row; returns False if it had to be dropped."""
+        with self.__stats_lock:
+            self.__stats['received'] += 1
+        try:
+            self.__queue.put_nowait(row)
+        except Full:
+            with self.__stats_lock:
+                self.__stats['blocked'] += 1
+            try:
+                self.__queue.put(row, timeout=self.put_timeout)
+            except Full:
+                with self.__stats_lock:
+                    self.__stats['dropped'] += 1
+                return False
+        backlog = self.__queue.qsize()
+        with self.__stats_lock:
+            if backlog > self.__stats['max_backlog']:
+                self.__stats['max_backlog'] = backlog
+        return True
+
+    def backlog(self):
+        return self.__queue.qsize()
+
+    def stats(self):
+        """Returns a snapshot of the ingest metrics."""
+        with self.__stats_lock:
+            stats = dict(self.__stats)
+        stats['backlog'] = self.__queue.qsize()
+        return stats
+
+    def close(self):
+        """Writes every queued row and stops the writer thread."""
+        self.__stop.set()
+        self.__thread.join()
+
+    def _next_batch(self):
+        batch = []
+        try:
+            # wait for the first row, waking up regularly to check __stop
+            batch.append(self.__queue.get(timeout=self.flush_interval))
+        except Empty:
+            return batch
+        deadline = time.time() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.__queue.get(timeout=timeout))
+            except Empty:
+                break
+        return batch
+
+    def _flush(self, conn, batch):
+        t0 = time.time()
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                time.sleep(self.retry_delay * 2 ** (attempt - 1))
+                with self.__stats_lock:
+                    self.__stats['retries'] += 1
+            try:
+                with conn:
+                    conn.executemany(self.sql, batch)
+                break
+            except sqlite3.Error as e:
+                self.__logger.error("flush of %d rows failed (attempt %d of %d): %s"
+                                    % (len(batch), attempt + 1, self.max_retries + 1, e))
+                with self.__stats_lock:
+                    self.__stats['errors'] += 1
+        else:
+            with self.__stats_lock:
+                self.__stats['dropped'] += len(batch)
+            return
+        with self.__stats_lock:
+            self.__stats['written'] += len(batch)
+            self.__stats['flushes'] += 1
+            self.__stats['last_flush_ms'] = (time.time() - t0) * 1e3
+
+    def _run(self):
+        conn = sqlite3.connect(self.path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        last_stats = time.time()
+        try:
+            while not (self.__stop.is_set() and self.__queue.empty()):
+                batch = self._next_batch()
+                if batch:
+                    self._flush(conn, batch)
+                if self.stats_interval and time.time() - last_stats >= self.stats_interval:
+                    last_stats = time.time()
+                    self.__logger.info("ingest stats: %s" % self.stats())
+        finally:
+            conn.close()
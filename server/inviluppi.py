@@ -0,0 +1,137 @@
+"""
+Envelope interpolation for the sifting loop of EMD_main.EMD.
+
+EMD.splinePoints built a new scipy.interpolate.interp1d for each of the
+two envelopes on every sifting iteration (or ran EMD.akima on each of
+them). Inviluppi interpolates both envelopes of an iteration at once:
+
+    - cubic: the not-a-knot cubic spline of interp1d(kind='cubic'),
+      whose second derivatives solve a tridiagonal system
+      (scipy.linalg.solve_banded, O(K) for K extrema)
+    - akima: the same piecewise polynomials as EMD.akima
+
+The polynomial coefficients of the two envelopes are stacked, and the
+envelopes are evaluated over the timeline in a single vectorized pass.
+An Inviluppi is bound to a timeline: EMD keeps the one of the signal it
+is decomposing for all its sifting iterations. It holds no state but the
+timeline, so an EMD instance can be shared between threads (e.g. by the
+trials of EEMD.eemd on a thread pool).
+"""
+import numpy as np
+from scipy.linalg import solve_banded
+
+
+def coefficientiCubica(X, Y, dtype=None):
+    """
+    Not-a-knot cubic spline through (X, Y), len(X) >= 4. Returns the
+    coefficients (a0, a1, a2, a3) of every interval [X[j], X[j+1]]:
+    a0 + a1*dx + a2*dx**2 + a3*dx**3 with dx = x - X[j].
+    dtype is unused (the spline is computed in double precision).
+    """
+    h = np.diff(X)
+    d = np.diff(Y) / h
+    n = len(X)
+
+    # h[i-1]*M[i-1] + 2*(h[i-1]+h[i])*M[i] + h[i]*M[i+1] = 6*(d[i]-d[i-1])
+    # for i = 1..n-2, where M are the second derivatives; the not-a-knot
+    # conditions give M[0] and M[n-1] as functions of their neighbours,
+    # substituted into the first and last equations.
+    ab = np.zeros((3, n - 2))
+    ab[0, 1:] = h[1:n - 2]
+    ab[1] = 2 * (h[:-1] + h[1:])
+    ab[2, :-1] = h[1:n - 2]
+    r = 6 * np.diff(d)
+
+    ab[1, 0] += h[0] * (h[0] + h[1]) / h[1]
+    ab[0, 1] -= h[0] * h[0] / h[1]
+    ab[1, -1] += h[-1] * (h[-1] + h[-2]) / h[-2]
+    ab[2, -2] -= h[-1] * h[-1] / h[-2]
+
+    M = np.empty(n)
+    M[1:-1] = solve_banded((1, 1), ab, r)
+    M[0] = ((h[0] + h[1]) * M[1] - h[0] * M[2]) / h[1]
+    M[-1] = ((h[-1] + h[-2]) * M[-2] - h[-1] * M[-3]) / h[-2]
+
+    a0 = Y[:-1]
+    a1 = d - h * (2 * M[:-1] + M[1:]) / 6
+    a2 = M[:-1] / 2
+    a3 = (M[1:] - M[:-1]) / (6 * h)
+    return a0, a1, a2, a3
+
+
+def coefficientiAkima(X, Y, dtype=None):
+    """
+    Coefficients of Akima's interpolation, as computed by EMD.akima
+    (including its rounding of the slopes to dtype).
+    """
+    n = len(X)
+    dx = np.diff(X)
+    if np.any(dx <= 0):
+        raise Exception('input x-array must be in strictly ascending order')
+    d = np.diff(Y) / dx
+
+    dpp = 2 * d[0] - d[1]
+    dp = 2 * dpp - d[0]
+    dn = 2 * d[n - 2] - d[n - 3]
+    dnn = 2 * dn - d[n - 2]
+    d1 = np.concatenate(([dpp], [dp], d, [dn], [dnn]))
+    if dtype is not None:
+        d1 = d1.astype(dtype)
+
+    w = np.abs(np.diff(d1), dtype=dtype)
+    w1, w2 = w[2:n + 2], w[:n]
+    w12 = w1 + w2
+
+    idx = np.nonzero(w12 > 1e-9 * np.max(w12))[0]
+    a1 = d1[1:n + 1].copy()
+    a1[idx] = (w1[idx] * d1[idx + 1] + w2[idx] * d1[idx + 2]) / w12[idx]
+    a2 = (3.0 * d - 2.0 * a1[0:n - 1] - a1[1:n]) / dx
+    a3 = (a1[0:n - 1] + a1[1:n] - 2.0 * d) / (dx * dx)
+    return Y[:-1], a1[:-1], a2, a3
+
+
+COEFFICIENTI = {
+    'cubic': coefficientiCubica,
+    'akima': coefficientiAkima,
+}
+
+
+class Inviluppi:
+    """
+    Evaluates the upper and lower envelopes over the timeline T.
+    """
+
+    def __init__(self, T):
+        self.T = np.asarray(T)
+        self.N = len(self.T)
+
+    def copre(self, maxExtrema, minExtrema):
+        """True if both sets of extrema span the whole timeline."""
+        return (maxExtrema[0, 0] <= self.T[0] and maxExtrema[0, -1] >= self.T[-1] and
+                minExtrema[0, 0] <= self.T[0] and minExtrema[0, -1] >= self.T[-1])
+
+    def valuta(self, maxExtrema, minExtrema, kind='cubic', dtype=None):
+        """
+        maxExtrema, minExtrema: positions (1st row) and values (2nd row)
+                                of at least 4 points each, spanning T
+        dtype: dtype of the signal (see coefficientiAkima)
+        Returns the two envelopes over T as rows of a (2, len(T)) array.
+        """
+        coefficienti = COEFFICIENTI[kind]
+        cMax = coefficienti(maxExtrema[0], maxExtrema[1], dtype)
+        cMin = coefficienti(minExtrema[0], minExtrema[1], dtype)
+        kMax = len(cMax[0])
+
+        # interval of every point of T, for both envelopes
+        # scratch buffers of this call: concurrent calls must not share them
+        intervalli = np.empty((2, self.N), dtype=np.intp)
+        dx = np.empty((2, self.N))
+        for riga, X, k, offset in ((0, maxExtrema[0], kMax, 0),
+                                   (1, minExtrema[0], len(cMin[0]), kMax)):
+            j = np.searchsorted(X, self.T, side='right') - 1
+            np.clip(j, 0, k - 1, out=j)
+            np.subtract(self.T, X[j], out=dx[riga])
+            np.add(j, offset, out=intervalli[riga])
+
+        a0, a1, a2, a3 = [np.concatenate((p, q))[intervalli] for p, q in zip(cMax, cMin)]
+        return ((a3 * dx + a2) * dx + a1) * dx + a0
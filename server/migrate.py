@@ -0,0 +1,21 @@
+"""
+Converts existing databases in place to the current schema version.
+
+    python migrate.py [data.db data2.db ...]
+
+server.py and provaMosquito.py must be stopped while migrating.
+"""
+from __future__ import print_function
+
+import sys
+
+import schema
+
+if __name__ == "__main__":
+    files = sys.argv[1:] or ['data.db']
+    for f in files:
+        prima, dopo = schema.migrate(f)
+        if prima == dopo:
+            print("%s: already at schema version %d" % (f, dopo))
+        else:
+            print("%s: schema version %d -> %d" % (f, prima, dopo))
@@ -1,6 +1,13 @@
 import paho.mqtt.client as mqtt
 import sqlite3
+import logging
+import time
+import schema
+from ingest import BatchWriter
 
+logging.basicConfig(level=logging.INFO)
+
+schema.migrate('data.db')
 conn = sqlite3.connect('data.db')
 c = conn.cursor()
 nome_ventola=["Ventola-Rotta","Ventola-Buona"]
@@ -13,11 +20,17 @@ try:
 except:
      print("test")
      pass
+conn.close()
+
+# i campioni vengono scritti a blocchi: una transazione ogni 500 campioni
+# o ogni 200 ms
+writer=BatchWriter('data.db',batch_size=500,flush_interval=0.2,max_backlog=100000)
+
 def on_message(client, userdata, message):
-    coordinates=message.payload.decode("utf-8").split(",")
-    coordinates[3]=coordinates[3].replace("\x00","")
-    c.execute("INSERT INTO Coordinate (X,Y,Z,Nome_Componente) VALUES (?,?,?,?)",(coordinates[1],coordinates[2],coordinates[3],coordinates[0]))
-    conn.commit()
+    # nome,X,Y,Z[,timestamp]: senza timestamp dall'edge si usa l'ora di ricezione
+    coordinates=message.payload.decode("utf-8").replace("\x00","").split(",")
+    timestamp=float(coordinates[4]) if len(coordinates)>4 else time.time()
+    writer.put((coordinates[1],coordinates[2],coordinates[3],coordinates[0],timestamp))
 
 client =mqtt.Client("test")
 user="prom2"
@@ -30,4 +43,7 @@ for i in range(0,len(nome_ventola)):
     client.subscribe("prom2/"+nome_ventola[i])
 #client.publish("prom2/test","ON")
 
-client.loop_forever()
+try:
+    client.loop_forever()
+finally:
+    writer.close()
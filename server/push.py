@@ -0,0 +1,190 @@
+"""
+Push of new samples and state changes to the dashboard over WebSocket.
+
+Instead of polling /dataUpdate every 500 ms per displayed fan, a client
+opens one WebSocket to /push and subscribes to the components it shows:
+
+    -> {"iscrivi": ["Ventola-Rotta", "Ventola-Buona"]}
+    <- {"nome": ..., "settore": ..., "cursore": 1234,
+        "datiX": [...], "datiY": [...], "datiZ": [...],
+        "statoAttuale": "sconosciuto"}       (first message: window and state)
+    <- {"nome": ..., "cursore": 1234, "datiX": [], ...,
+        "statoAttuale": "buono"}                  (its first classification)
+    <- {"nome": ..., "cursore": 1240,
+        "datiX": [...], "datiY": [...], "datiZ": [...]}   (new samples)
+    <- {"nome": ..., "cursore": 1241, ..., "statoAttuale": "rotto"}
+    -> {"disiscrivi": ["Ventola-Buona"]}
+
+cursore is the ID_Coordinate of the newest sample sent; statoAttuale is
+only sent when it changes.
+
+Hub polls the sample store on a timer, once for all the clients, and is
+notified (notifica) by the classifier when the state of a component
+changes, so that a state computed after its samples were pushed is sent
+at once, even if no other sample arrives. States are read without
+waiting for a classification. Every message is encoded once for all the
+clients it goes to (those which received the same samples and state so
+far): the cost per client is that of writing the new samples, whatever
+the poll rate and window length.
+"""
+import json
+import logging
+
+import tornado.ioloop
+import tornado.websocket
+
+
+class Hub:
+    """
+    store: sample_buffer.SampleStore
+    refresh: coroutine function fetching the new samples into store
+             (e.g. running store.refresh on the database threads)
+    stato: function returning the current label of a component, without
+           waiting for its classification
+    finestra: samples of the window sent when a client subscribes
+    intervallo: milliseconds between two polls of the store
+    """
+
+    def __init__(self, store, refresh, stato, finestra=200, intervallo=500):
+        self.__logger = logging.getLogger('PUSH')
+        self.store = store
+        self.refresh = refresh
+        self.stato = stato
+        self.finestra = finestra
+        self.intervallo = intervallo
+        # nome -> {client: (cursor, label)} of the last message sent
+        self.iscritti = {}
+        self.__timer = None
+        self.__in_corso = False
+
+    def start(self):
+        self.__timer = tornado.ioloop.PeriodicCallback(self.aggiorna, self.intervallo)
+        self.__timer.start()
+
+    def stop(self):
+        if self.__timer is not None:
+            self.__timer.stop()
+
+    def iscrivi(self, client, nomi):
+        """
+        Subscribes client to the components nomi, sending their windows
+        and current states at once.
+        """
+        for nome in nomi:
+            if nome not in self.store.buffers:
+                client.invia(json.dumps({"nome": nome, "errore": "unknown component"}))
+                continue
+            # the cursor must be that of the samples sent, whatever a
+            # concurrent refresh appends
+            ids, _, dataX, dataY, dataZ = self.store.snapshot(nome, self.finestra)
+            last_id = int(ids[-1])
+            stato = self.stato(nome)
+            if client.invia(json.dumps({
+                "nome": nome,
+                "settore": self.store.sectors[nome],
+                "cursore": last_id,
+                "datiX": dataX.tolist(),
+                "datiY": dataY.tolist(),
+                "datiZ": dataZ.tolist(),
+                "statoAttuale": stato,
+            })):
+                self.iscritti.setdefault(nome, {})[client] = (last_id, stato)
+
+    def disiscrivi(self, client, nomi=None):
+        """Unsubscribes client from nomi, or from every component."""
+        for nome in list(self.iscritti if nomi is None else nomi):
+            clients = self.iscritti.get(nome, {})
+            clients.pop(client, None)
+            if not clients:
+                self.iscritti.pop(nome, None)
+
+    def notifica(self, nome):
+        """
+        Sends the new state of component nome to its subscribers (with the
+        samples they miss), e.g. when a classification finishes.
+        """
+        try:
+            self._invia(nome)
+        except Exception:
+            self.__logger.exception("push of the state of %s failed", nome)
+
+    async def aggiorna(self):
+        """Sends the samples arrived since the last poll to the subscribers."""
+        if self.__in_corso or not self.iscritti:
+            return
+        self.__in_corso = True
+        try:
+            await self.refresh()
+            for nome in list(self.iscritti):
+                self._invia(nome)
+        except Exception:
+            self.__logger.exception("push update failed")
+        finally:
+            self.__in_corso = False
+
+    def _invia(self, nome):
+        clients = self.iscritti.get(nome)
+        if not clients:
+            return
+        last_id, _ = self.store.cursor(nome)
+        stato = self.stato(nome)
+        if all(chiave == (last_id, stato) for chiave in clients.values()):
+            return
+
+        # clients at the same cursor and state get the same message
+        gruppi = {}
+        for client, chiave in list(clients.items()):
+            gruppi.setdefault(chiave, []).append(client)
+        for (cursore, precedente), destinatari in gruppi.items():
+            ids, dataX, dataY, dataZ = self.store.since(nome, cursore)
+            if len(ids) == 0 and stato == precedente:
+                continue
+            messaggio = {
+                "nome": nome,
+                "cursore": int(ids[-1]) if len(ids) else cursore,
+                "datiX": dataX.tolist(),
+                "datiY": dataY.tolist(),
+                "datiZ": dataZ.tolist(),
+            }
+            if stato != precedente:
+                messaggio["statoAttuale"] = stato
+            testo = json.dumps(messaggio)
+            for client in destinatari:
+                if client.invia(testo):
+                    clients[client] = (messaggio["cursore"], stato)
+                else:
+                    self.disiscrivi(client)
+
+
+class pushDati(tornado.websocket.WebSocketHandler):
+    """WebSocket endpoint of a Hub (see the module docstring)."""
+
+    def initialize(self, hub):
+        self.hub = hub
+
+    def check_origin(self, origin):
+        # the dashboard is served from another origin, as for the
+        # Access-Control-Allow-Origin: * of the HTTP handlers
+        return True
+
+    def invia(self, testo):
+        """Sends a message; False if the connection is gone."""
+        try:
+            self.write_message(testo)
+            return True
+        except tornado.websocket.WebSocketClosedError:
+            return False
+
+    def on_message(self, message):
+        try:
+            richiesta = json.loads(message)
+        except ValueError:
+            self.invia(json.dumps({"errore": "invalid JSON"}))
+            return
+        if "iscrivi" in richiesta:
+            self.hub.iscrivi(self, richiesta["iscrivi"])
+        if "disiscrivi" in richiesta:
+            self.hub.disiscrivi(self, richiesta["disiscrivi"])
+
+    def on_close(self):
+        self.hub.disiscrivi(self)
@@ -0,0 +1,227 @@
+"""
+Retention of the raw samples and downsampled rollups.
+
+Every run of Retention.esegui():
+    1. rolls the raw samples of every completed minute into Rollup_Minuto
+       (per axis RMS and peak, plus the 18 features of the newest 100
+       samples of the minute) and every completed hour of minute rollups
+       into Rollup_Ora;
+    2. moves the raw samples of past days from Coordinate into the daily
+       partitions Coordinate_YYYYMMDD (see schema.py), keeping in
+       Coordinate the newest samples of every component so that the
+       dashboard buffers can always be primed, and the oldest ones,
+       the reference window of /loadRefData (SampleStore.reference);
+    3. drops the partitions older than giorni_raw days, and the rollups
+       older than their own retention, as whole tables/ranges.
+
+Samples stored before schema version 1 have no timestamp: they are
+neither rolled up nor partitioned.
+
+    python retention.py [data.db]
+
+runs the job every `intervallo` seconds; it can run alongside server.py
+and provaMosquito.py.
+"""
+from __future__ import print_function
+
+import logging
+import sqlite3
+import sys
+import time
+
+import numpy as np
+
+import cuscinetto
+import schema
+from calcoloArea import calcoloFeatures_batch, FS
+from database import SQL_CUSCINETTO
+
+FINESTRA = 100  # campioni usati per le features di ogni minuto
+
+
+class Retention:
+
+    def __init__(self, path):
+        self.__logger = logging.getLogger('RETENTION')
+        self.path = path
+
+        # Retention, in days (None: forever)
+        self.giorni_raw = 7
+        self.giorni_minuti = 30
+        self.giorni_ore = None
+
+        # Newest samples of every component never moved out of Coordinate
+        self.conserva_ultimi = 200
+        # Oldest samples of every component never moved out of Coordinate
+        # (nor dropped): at least the reference window of server.py
+        self.conserva_primi = 200
+
+        # Seconds between two runs of the job
+        self.intervallo = 60
+
+    def connetti(self):
+        conn = sqlite3.connect(self.path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    ###################################################
+    ## Rollups
+
+    def _componenti(self, conn):
+        return [r[0] for r in conn.execute("SELECT Nome FROM Componente")]
+
+    def _ultimo_rollup(self, conn, tabella, nome):
+        return conn.execute("SELECT MAX(Inizio) FROM `%s` WHERE Nome_Componente=?" % tabella,
+                            (nome,)).fetchone()[0]
+
+    def rollup_minuti(self, conn, adesso):
+        """Rolls up the raw samples of every completed minute."""
+        fine = np.floor(adesso / 60.) * 60
+        righe = 0
+        for nome in self._componenti(conn):
+            ultimo = self._ultimo_rollup(conn, 'Rollup_Minuto', nome)
+            inizio = -np.inf if ultimo is None else ultimo + 60
+            campioni = conn.execute("SELECT Timestamp, X, Y, Z FROM Coordinate "
+                                    "WHERE Nome_Componente=? AND Timestamp>=? AND Timestamp<? "
+                                    "ORDER BY Timestamp", (nome, inizio, fine)).fetchall()
+            if not campioni:
+                continue
+            campioni = np.array(campioni, dtype=np.float64)
+            minuti = np.floor(campioni[:, 0] / 60.) * 60
+            inizi, primi, conteggi = np.unique(minuti, return_index=True, return_counts=True)
+
+            rollup = np.full((len(inizi), len(schema.COLONNE_ROLLUP)), np.nan)
+            rollup[:, 0] = conteggi
+            finestre, con_features = [], []
+            for i, (p, n) in enumerate(zip(primi, conteggi)):
+                xyz = campioni[p:p + n, 1:]
+                rollup[i, 1:4] = np.sqrt(np.mean(xyz ** 2, axis=0))
+                rollup[i, 4:7] = np.max(np.abs(xyz), axis=0)
+                if n >= FINESTRA:
+                    finestre.append(xyz[-FINESTRA:].T)
+                    con_features.append(i)
+            if finestre:
+                c = cuscinetto.daRiga(conn.execute(SQL_CUSCINETTO, (nome,)).fetchone(), FS, nome)
+                rollup[con_features, 7:] = calcoloFeatures_batch(finestre, cuscinetto=c)
+            righe += self._scrivi(conn, 'Rollup_Minuto', nome, inizi, rollup)
+        return righe
+
+    def rollup_ore(self, conn, adesso):
+        """Rolls up the minute rollups of every completed hour."""
+        fine = np.floor(adesso / 3600.) * 3600
+        righe = 0
+        for nome in self._componenti(conn):
+            ultimo = self._ultimo_rollup(conn, 'Rollup_Ora', nome)
+            inizio = -np.inf if ultimo is None else ultimo + 3600
+            minuti = conn.execute("SELECT Inizio, %s FROM Rollup_Minuto "
+                                  "WHERE Nome_Componente=? AND Inizio>=? AND Inizio<? ORDER BY Inizio"
+                                  % ", ".join(schema.COLONNE_ROLLUP), (nome, inizio, fine)).fetchall()
+            if not minuti:
+                continue
+            minuti = np.array(minuti, dtype=np.float64)  # NULL -> nan
+            ore = np.floor(minuti[:, 0] / 3600.) * 3600
+            inizi, primi, conteggi = np.unique(ore, return_index=True, return_counts=True)
+
+            rollup = np.full((len(inizi), len(schema.COLONNE_ROLLUP)), np.nan)
+            for i, (p, n) in enumerate(zip(primi, conteggi)):
+                m = minuti[p:p + n, 1:]
+                campioni = m[:, 0]
+                rollup[i, 0] = campioni.sum()
+                rollup[i, 1:4] = np.sqrt(np.sum(campioni[:, None] * m[:, 1:4] ** 2, axis=0) / campioni.sum())
+                rollup[i, 4:7] = np.max(m[:, 4:7], axis=0)
+                features = m[:, 7:]
+                validi = ~np.isnan(features[:, 0])
+                if np.any(validi):
+                    rollup[i, 7:] = np.mean(features[validi], axis=0)
+            righe += self._scrivi(conn, 'Rollup_Ora', nome, inizi, rollup)
+        return righe
+
+    def _scrivi(self, conn, tabella, nome, inizi, rollup):
+        righe = []
+        for inizio, valori in zip(inizi, rollup):
+            valori = [None if np.isnan(v) else float(v) for v in valori]
+            valori[0] = int(valori[0])
+            righe.append([nome, float(inizio)] + valori)
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO `%s` (Nome_Componente, Inizio, %s) VALUES (%s)"
+                             % (tabella, ", ".join(schema.COLONNE_ROLLUP),
+                                ", ".join(["?"] * (len(schema.COLONNE_ROLLUP) + 2))), righe)
+        return len(righe)
+
+    ###################################################
+    ## Partitions
+
+    def partiziona(self, conn, adesso):
+        """Moves the raw samples of the days before today into their partitions."""
+        oggi = int(adesso // 86400)
+        spostati = 0
+        for nome in self._componenti(conn):
+            # the newest samples stay in Coordinate
+            soglia = conn.execute("SELECT ID_Coordinate FROM Coordinate WHERE Nome_Componente=? "
+                                  "ORDER BY ID_Coordinate DESC LIMIT 1 OFFSET ?",
+                                  (nome, self.conserva_ultimi - 1)).fetchone()
+            # and so do the oldest ones
+            primi = conn.execute("SELECT ID_Coordinate FROM Coordinate WHERE Nome_Componente=? "
+                                 "ORDER BY ID_Coordinate LIMIT 1 OFFSET ?",
+                                 (nome, self.conserva_primi - 1)).fetchone() if self.conserva_primi else (0,)
+            if soglia is None or primi is None:
+                continue
+            giorni = conn.execute("SELECT DISTINCT CAST(Timestamp/86400 AS INTEGER) FROM Coordinate "
+                                  "WHERE Nome_Componente=? AND Timestamp<? AND ID_Coordinate<? "
+                                  "AND ID_Coordinate>?",
+                                  (nome, oggi * 86400, soglia[0], primi[0])).fetchall()
+            for (giorno,) in giorni:
+                condizione = ("Nome_Componente=? AND Timestamp>=? AND Timestamp<? AND ID_Coordinate<? "
+                              "AND ID_Coordinate>?",
+                              (nome, giorno * 86400, (giorno + 1) * 86400, soglia[0], primi[0]))
+                with conn:
+                    tabella = schema.crea_partizione(conn, giorno)
+                    conn.execute("INSERT OR IGNORE INTO `%s` SELECT ID_Coordinate, X, Y, Z, Nome_Componente, "
+                                 "Timestamp FROM Coordinate WHERE %s" % (tabella, condizione[0]),
+                                 condizione[1])
+                    spostati += conn.execute("DELETE FROM Coordinate WHERE %s" % condizione[0],
+                                             condizione[1]).rowcount
+        return spostati
+
+    def elimina_scaduti(self, conn, adesso):
+        """Drops the expired partitions and rollups."""
+        eliminate = []
+        if self.giorni_raw is not None:
+            limite = int(adesso // 86400) - self.giorni_raw
+            for giorno, tabella in sorted(schema.partizioni(conn).items()):
+                if giorno < limite:
+                    with conn:
+                        conn.execute("DROP TABLE `%s`" % tabella)
+                    eliminate.append(tabella)
+        for tabella, giorni in (('Rollup_Minuto', self.giorni_minuti), ('Rollup_Ora', self.giorni_ore)):
+            if giorni is not None:
+                with conn:
+                    conn.execute("DELETE FROM `%s` WHERE Inizio<?" % tabella, (adesso - giorni * 86400,))
+        return eliminate
+
+    def esegui(self, adesso=None):
+        if adesso is None:
+            adesso = time.time()
+        conn = self.connetti()
+        try:
+            minuti = self.rollup_minuti(conn, adesso)
+            ore = self.rollup_ore(conn, adesso)
+            spostati = self.partiziona(conn, adesso)
+            eliminate = self.elimina_scaduti(conn, adesso)
+        finally:
+            conn.close()
+        self.__logger.info("rollup: %d minuti, %d ore; %d campioni partizionati; partizioni eliminate: %s"
+                           % (minuti, ore, spostati, eliminate))
+
+    def loop(self):
+        while True:
+            t0 = time.time()
+            self.esegui()
+            time.sleep(max(0, self.intervallo - (time.time() - t0)))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    path = sys.argv[1] if len(sys.argv) > 1 else 'data.db'
+    schema.migrate(path)
+    Retention(path).loop()
@@ -0,0 +1,217 @@
+"""
+In-process sample buffers for the dashboard handlers.
+
+Every component keeps the last `capacity` accelerometer samples in a
+fixed-size numpy ring buffer. The buffers are primed from the tail of the
+Coordinate table and then kept current by fetching only the rows whose
+ID_Coordinate is greater than the last one seen, so reading a window costs
+O(window) no matter how much history is stored in data.db.
+"""
+import threading
+
+import numpy as np
+
+import cuscinetto
+from database import (SQL_COMPONENTI, SQL_SEZIONE, SQL_CUSCINETTO, SQL_ULTIMI_CAMPIONI,
+                      SQL_PRIMI_CAMPIONI, SQL_NUOVI_CAMPIONI)
+
+
+class RingBuffer:
+    """Fixed-size circular buffer of (X, Y, Z) samples and their ids."""
+
+    def __init__(self, capacity, channels=3, dtype=np.float64):
+        self.capacity = capacity
+        self.data = np.zeros((capacity, channels), dtype=dtype)
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.count = 0  # samples appended since creation
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    @property
+    def last_id(self):
+        """ID_Coordinate of the newest sample, 0 when empty."""
+        if self.count == 0:
+            return 0
+        return int(self.ids[(self.count - 1) % self.capacity])
+
+    def extend(self, ids, rows):
+        """Appends samples (oldest first), overwriting the oldest ones."""
+        ids = np.asarray(ids, dtype=np.int64)
+        rows = np.asarray(rows, dtype=self.data.dtype).reshape(len(ids), -1)
+        n = len(ids)
+        if n == 0:
+            return
+        if n > self.capacity:
+            # only the newest `capacity` samples can survive anyway
+            self.count += n - self.capacity
+            ids, rows = ids[-self.capacity:], rows[-self.capacity:]
+            n = self.capacity
+        pos = (self.count + np.arange(n)) % self.capacity
+        self.ids[pos] = ids
+        self.data[pos] = rows
+        self.count += n
+
+    def last(self, n):
+        """Returns (ids, samples) of the newest n samples, oldest first."""
+        n = min(n, len(self))
+        pos = (self.count - n + np.arange(n)) % self.capacity
+        return self.ids[pos], self.data[pos]
+
+
+class SampleStore:
+    """
+    Per-component ring buffers backed by the Coordinate table.
+
+    db: database.Database on the file written by provaMosquito.py
+    capacity: number of samples kept per component, i.e. the largest
+              window the handlers can ask for
+    fs: sample rate the bearings are checked against (see
+        cuscinetto.daRiga), not checked if None
+    """
+
+    def __init__(self, db, capacity=200, fs=None):
+        self.db = db
+        self.capacity = capacity
+        self.fs = fs
+        self.buffers = {}
+        self.sectors = {}
+        self.bearings = {}  # cuscinetto.Cuscinetto, None for the default one
+        self.references = {}
+        self.last_id = 0
+        self.__lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """(Re)primes every buffer from the tail of the Coordinate table."""
+        # queried without the lock, which the readers on the IOLoop take
+        sectors = dict(self.db.fetchall(SQL_COMPONENTI))
+        bearings = self.db.cuscinetti(self.fs)
+        buffers = {}
+        for nome in sectors:
+            buf = self._prime(nome)
+            if buf is not None:
+                buffers[nome] = buf
+        with self.__lock:
+            self.buffers = buffers
+            self.sectors = sectors
+            self.bearings = bearings
+            self.last_id = max([buf.last_id for buf in buffers.values()] + [0])
+
+    def _prime(self, nome):
+        rows = self.db.fetchall(SQL_ULTIMI_CAMPIONI, (nome, self.capacity))
+        if not rows:
+            # as with the original INNER JOIN, a component is served only
+            # once it has samples: refresh() adds its buffer then
+            return None
+        buf = RingBuffer(self.capacity)
+        rows = np.array(rows[::-1], dtype=np.float64)
+        buf.extend(rows[:, 0], rows[:, 1:])
+        return buf
+
+    def refresh(self):
+        """
+        Appends the samples stored since the last call. Returns the number
+        of new samples.
+
+        The queries run without the lock, so the readers (cursor, window,
+        snapshot, since) never wait on the database; the lock is only taken
+        to append the rows. Concurrent refreshes may fetch the same rows:
+        a buffer only takes the ones newer than its newest sample.
+        """
+        rows = self.db.fetchall(SQL_NUOVI_CAMPIONI, (self.last_id,))
+        if not rows:
+            return 0
+        grouped = {}
+        for r in rows:
+            grouped.setdefault(r[4], []).append(r[:4])
+        # components registered in Componente after load()
+        nuovi = {}
+        for nome in grouped:
+            if nome not in self.sectors:
+                sector = self.db.fetchone(SQL_SEZIONE, (nome,))
+                if sector is None:
+                    # samples of components not registered in Componente
+                    # are never served, as with the original INNER JOIN
+                    continue
+                nuovi[nome] = (sector[0], cuscinetto.daRiga(self.db.fetchone(SQL_CUSCINETTO, (nome,)),
+                                                            self.fs, nome))
+        aggiunti = 0
+        with self.__lock:
+            for nome, (sector, bearing) in nuovi.items():
+                self.sectors.setdefault(nome, sector)
+                self.bearings.setdefault(nome, bearing)
+            for nome, samples in grouped.items():
+                if nome not in self.sectors:
+                    continue
+                samples = np.array(samples, dtype=np.float64)
+                if nome in self.buffers:
+                    samples = samples[samples[:, 0] > self.buffers[nome].last_id]
+                if len(samples) == 0:
+                    continue
+                if nome not in self.buffers:
+                    self.buffers[nome] = RingBuffer(self.capacity)
+                self.buffers[nome].extend(samples[:, 0], samples[:, 1:])
+                aggiunti += len(samples)
+            self.last_id = max(self.last_id, rows[-1][0])
+        return aggiunti
+
+    def components(self):
+        """Components with at least one sample."""
+        return list(self.buffers.keys())
+
+    def cursor(self, nome):
+        """
+        Returns (last_id, seq) for component nome: the ID_Coordinate of its
+        newest sample and the number of samples buffered since start-up.
+        """
+        with self.__lock:
+            buf = self.buffers[nome]
+            return buf.last_id, buf.count
+
+    def window(self, nome, n):
+        """
+        Returns the newest n samples of component nome as three arrays
+        (X, Y, Z), oldest first. Raises KeyError for unknown components.
+        """
+        with self.__lock:
+            _, samples = self.buffers[nome].last(n)
+        return samples[:, 0], samples[:, 1], samples[:, 2]
+
+    def snapshot(self, nome, n):
+        """
+        Returns (ids, seq, X, Y, Z): the newest n samples of component nome
+        as in window(), their ids and the seq of cursor(), read together.
+        """
+        with self.__lock:
+            buf = self.buffers[nome]
+            ids, samples = buf.last(n)
+            seq = buf.count
+        return ids, seq, samples[:, 0], samples[:, 1], samples[:, 2]
+
+    def since(self, nome, last_id):
+        """
+        Returns the buffered samples of component nome newer than
+        ID_Coordinate last_id as four arrays (ids, X, Y, Z), oldest first.
+        At most the newest `capacity` samples are available: a client
+        further behind only gets those. Raises KeyError for unknown
+        components.
+        """
+        with self.__lock:
+            buf = self.buffers[nome]
+            ids, samples = buf.last(len(buf))
+        k = np.searchsorted(ids, last_id, side='right')
+        return ids[k:], samples[k:, 0], samples[k:, 1], samples[k:, 2]
+
+    def reference(self, nome, n):
+        """
+        Returns the first n samples ever stored for component nome as
+        (X, Y, Z). They never change, so they are read only once, and
+        retention.py keeps them in Coordinate (Retention.conserva_primi).
+        """
+        key = (nome, n)
+        if key not in self.references:
+            rows = self.db.fetchall(SQL_PRIMI_CAMPIONI, (nome, n))
+            samples = np.array(rows, dtype=np.float64).reshape(-1, 3)
+            self.references[key] = (samples[:, 0], samples[:, 1], samples[:, 2])
+        return self.references[key]
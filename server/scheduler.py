@@ -0,0 +1,187 @@
+"""
+Continuous classification of every component, independent of the HTTP
+requests.
+
+Without it a fan is classified only when a browser asks for its state:
+nobody watching means nobody notices a failure, and several dashboards
+watching the same fan trigger the same work. Scheduler instead polls the
+sample store on a timer and classifies a component when
+
+    - it was never classified, or
+    - ogni_campioni new samples arrived since its last classification, or
+    - ogni_secondi passed since then and at least one new sample arrived
+
+(a window with no new samples would give the same result). The handlers
+only read the latest Risultato of a component: a poll costs a dictionary
+lookup, however many dashboards show the component, and Risultato.cursore
+tells the window (component, newest ID_Coordinate) it was computed from.
+Memory is bounded by the number of components, one Risultato each. A
+classification that
+fails is recorded as a Risultato too, with its error and no label, and
+retried at the same cadence: nobody waits on a component that cannot be
+classified, and components without samples have no Risultato at all.
+
+At most `massimo` classifications run at a time, normally the number of
+worker processes; when more components are due, they are taken by
+priority: first those whose last label is in `allarme` (e.g. rotto and
+danneggiato), then those whose samples arrive fastest, then the oldest
+result.
+"""
+from collections import namedtuple
+import datetime
+import logging
+import time
+
+import tornado.ioloop
+import tornado.locks
+import tornado.util
+
+# indice: label index; confidenza: see feature_pool.predict_confidenza;
+# istante: epoch seconds of the classification; cursore: ID_Coordinate
+# of the newest sample of the window; errore: None, or the message of the
+# exception of a failed classification (indice and confidenza are None)
+Risultato = namedtuple('Risultato', 'indice confidenza istante cursore errore')
+
+_ALFA = 0.3  # weight of the newest sample rate in its moving average
+
+
+class _Componente:
+
+    def __init__(self):
+        self.risultato = None
+        self.seq = None          # RingBuffer.count at the last classification
+        self.tentativo = 0.0     # time of the last classification started
+        self.velocita = 0.0      # samples per second, moving average
+        self.ultimo_seq = None   # RingBuffer.count at the last poll
+        self.ultimo_poll = None
+        self.pronto = tornado.locks.Event()  # set by the first result
+
+
+class Scheduler:
+    """
+    store: sample_buffer.SampleStore
+    refresh: coroutine function fetching the new samples into store
+    classifica: coroutine function classifying the current window of a
+                component, returning (label index, confidence)
+    pubblica: function called with (nome, Risultato) on every new result
+              (e.g. to update the fleet state table), or None
+    ogni_campioni, ogni_secondi: cadence, see the module docstring
+    massimo: classifications running at the same time
+    allarme: label indices classified before the others
+    intervallo: milliseconds between two polls of the store
+    """
+
+    def __init__(self, store, refresh, classifica, pubblica=None, ogni_campioni=25,
+                 ogni_secondi=5.0, massimo=1, allarme=(), intervallo=500):
+        if ogni_campioni < 1:
+            raise ValueError('ogni_campioni must be at least 1')
+        if massimo < 1:
+            raise ValueError('massimo must be at least 1')
+        self.__logger = logging.getLogger('SCHEDULER')
+        self.store = store
+        self.refresh = refresh
+        self.classifica = classifica
+        self.pubblica = pubblica
+        self.ogni_campioni = ogni_campioni
+        self.ogni_secondi = ogni_secondi
+        self.massimo = massimo
+        self.allarme = frozenset(allarme)
+        self.intervallo = intervallo
+        self.componenti = {}
+        self.in_corso = set()
+        self.__timer = None
+        self.__poll_in_corso = False
+
+    def start(self):
+        self.__timer = tornado.ioloop.PeriodicCallback(self.aggiorna, self.intervallo)
+        self.__timer.start()
+        tornado.ioloop.IOLoop.current().spawn_callback(self.aggiorna)
+
+    def stop(self):
+        if self.__timer is not None:
+            self.__timer.stop()
+
+    def risultato(self, nome):
+        """The latest Risultato of component nome, None if not classified yet."""
+        c = self.componenti.get(nome)
+        return c.risultato if c is not None else None
+
+    async def attendi(self, nome, timeout=None):
+        """
+        The latest Risultato of component nome, waiting for the first one
+        (successful or not) if needed, at most timeout seconds. Returns
+        None for components without samples, or on timeout.
+        """
+        if nome not in self.store.buffers:
+            return None
+        c = self._componente(nome)
+        try:
+            await c.pronto.wait(None if timeout is None else datetime.timedelta(seconds=timeout))
+        except tornado.util.TimeoutError:
+            pass
+        return c.risultato
+
+    def _componente(self, nome):
+        if nome not in self.componenti:
+            self.componenti[nome] = _Componente()
+        return self.componenti[nome]
+
+    async def aggiorna(self):
+        """Polls the store and starts the classifications that are due."""
+        if self.__poll_in_corso:
+            return
+        self.__poll_in_corso = True
+        try:
+            await self.refresh()
+            adesso = time.time()
+            dovuti = [nome for nome in self.store.components()
+                      if self._dovuto(nome, adesso) and nome not in self.in_corso]
+            dovuti.sort(key=self._priorita)
+            for nome in dovuti[:self.massimo - len(self.in_corso)]:
+                self.in_corso.add(nome)
+                tornado.ioloop.IOLoop.current().spawn_callback(self._classifica, nome)
+        except Exception:
+            self.__logger.exception("scheduler poll failed")
+        finally:
+            self.__poll_in_corso = False
+
+    def _dovuto(self, nome, adesso):
+        c = self._componente(nome)
+        _, seq = self.store.cursor(nome)
+        # sample rate, from the samples buffered between two polls
+        if c.ultimo_poll is not None and adesso > c.ultimo_poll:
+            velocita = (seq - c.ultimo_seq) / (adesso - c.ultimo_poll)
+            c.velocita += _ALFA * (velocita - c.velocita)
+        c.ultimo_seq, c.ultimo_poll = seq, adesso
+        if seq == 0:
+            return False  # nothing to classify yet
+        if c.seq is None:
+            return True
+        nuovi = seq - c.seq
+        return nuovi >= self.ogni_campioni or (nuovi > 0 and adesso - c.tentativo >= self.ogni_secondi)
+
+    def _priorita(self, nome):
+        c = self.componenti[nome]
+        allarme = c.risultato is not None and c.risultato.indice in self.allarme
+        return (not allarme, -c.velocita, c.tentativo)
+
+    async def _classifica(self, nome):
+        c = self.componenti[nome]
+        try:
+            cursore, seq = self.store.cursor(nome)
+            c.tentativo = time.time()
+            c.seq = seq
+            try:
+                indice, confidenza = await self.classifica(nome)
+                c.risultato = Risultato(indice, confidenza, time.time(), cursore, None)
+            except Exception as e:
+                # retried after ogni_secondi, or ogni_campioni new samples
+                self.__logger.exception("classification of %s failed", nome)
+                c.risultato = Risultato(None, None, time.time(), cursore, str(e) or type(e).__name__)
+            c.pronto.set()
+            if self.pubblica is not None:
+                self.pubblica(nome, c.risultato)
+        except Exception:
+            self.__logger.exception("publishing the state of %s failed", nome)
+        finally:
+            self.in_corso.discard(nome)
@@ -0,0 +1,152 @@
+"""
+Versioned schema of data.db.
+
+The version is stored in PRAGMA user_version. Every entry of MIGRAZIONI
+brings the database from version i to version i+1; migrate() applies the
+missing ones in place, each in its own transaction, and is a no-op on an
+up-to-date database.
+
+Version 1:
+    - Coordinate.Timestamp (REAL, epoch seconds) for every new sample;
+      rows stored before the migration keep a NULL timestamp
+    - covering index (Nome_Componente, ID_Coordinate, X, Y, Z): the
+      "latest N samples of a component" read becomes an index range scan
+    - index (Nome_Componente, Timestamp) for "samples between t0 and t1"
+
+Version 2:
+    - Rollup_Minuto and Rollup_Ora: per component and per minute/hour,
+      number of samples, RMS and peak of every axis and the 18 features
+      of calcoloFeatures (see retention.py)
+
+Version 3:
+    - bearing geometry and speed of every component, in the Componente
+      columns COLONNE_CUSCINETTO (number of balls, RPM, ball and pitch
+      diameters, contact angle in radians); NULL for the existing rows,
+      which keep the default bearing (calcoloArea.CUSCINETTO)
+
+Raw samples older than the current day are moved by retention.py into
+daily partitions Coordinate_YYYYMMDD (UTC) with the same columns, so
+that expired days can be dropped as whole tables.
+"""
+import calendar
+import sqlite3
+import time
+
+# nomi delle 18 features di calcoloFeatures, nell'ordine di calcoloFeatures_batch
+COLONNE_FEATURES = ["%s_%s" % (f, asse) for asse in "XYZ"
+                    for f in ("FOR", "FIR", "FB", "MaxFOR", "MaxFIR", "MaxFB")]
+COLONNE_ROLLUP = (["Campioni"] + ["RMS_%s" % a for a in "XYZ"] +
+                  ["Picco_%s" % a for a in "XYZ"] + COLONNE_FEATURES)
+TABELLE_ROLLUP = {'minuto': ('Rollup_Minuto', 60), 'ora': ('Rollup_Ora', 3600)}
+# geometria del cuscinetto di ogni componente, nell'ordine di cuscinetto.Cuscinetto
+COLONNE_CUSCINETTO = ["Sfere", "RPM", "Diametro_Sfere", "Diametro_Primitivo", "Angolo_Contatto"]
+
+PREFISSO_PARTIZIONE = "Coordinate_"
+
+
+def _colonne(conn, tabella):
+    return [r[1] for r in conn.execute("PRAGMA table_info(%s)" % tabella)]
+
+
+def _versione_1(conn):
+    conn.execute("CREATE TABLE IF NOT EXISTS `Componente` ("
+                 "`Nome` TEXT, `Sezione` TEXT NOT NULL, PRIMARY KEY(Nome))")
+    conn.execute("CREATE TABLE IF NOT EXISTS `Coordinate` ("
+                 "`ID_Coordinate` INTEGER PRIMARY KEY AUTOINCREMENT, "
+                 "`X` REAL NOT NULL, `Y` REAL NOT NULL, `Z` REAL NOT NULL, "
+                 "`Nome_Componente` TEXT NOT NULL)")
+    if 'Timestamp' not in _colonne(conn, 'Coordinate'):
+        conn.execute("ALTER TABLE Coordinate ADD COLUMN `Timestamp` REAL")
+    conn.execute("CREATE INDEX IF NOT EXISTS Coordinate_Componente_ID "
+                 "ON Coordinate (Nome_Componente, ID_Coordinate, X, Y, Z)")
+    conn.execute("CREATE INDEX IF NOT EXISTS Coordinate_Componente_Timestamp "
+                 "ON Coordinate (Nome_Componente, Timestamp)")
+
+
+def _versione_2(conn):
+    colonne = ", ".join("`%s` REAL" % c for c in COLONNE_ROLLUP[1:])
+    for tabella, _ in TABELLE_ROLLUP.values():
+        conn.execute("CREATE TABLE IF NOT EXISTS `%s` ("
+                     "`Nome_Componente` TEXT NOT NULL, `Inizio` REAL NOT NULL, "
+                     "`Campioni` INTEGER NOT NULL, %s, "
+                     "PRIMARY KEY(Nome_Componente, Inizio))" % (tabella, colonne))
+
+
+def _versione_3(conn):
+    colonne = _colonne(conn, 'Componente')
+    for c, tipo in zip(COLONNE_CUSCINETTO, ('INTEGER', 'REAL', 'REAL', 'REAL', 'REAL')):
+        if c not in colonne:
+            conn.execute("ALTER TABLE Componente ADD COLUMN `%s` %s" % (c, tipo))
+
+
+MIGRAZIONI = [
+    _versione_1,
+    _versione_2,
+    _versione_3,
+]
+
+SCHEMA_VERSION = len(MIGRAZIONI)
+
+
+def nome_partizione(giorno):
+    """Name of the raw partition of day giorno (days since the epoch, UTC)."""
+    return PREFISSO_PARTIZIONE + time.strftime("%Y%m%d", time.gmtime(giorno * 86400))
+
+
+def giorno_partizione(nome):
+    """Inverse of nome_partizione."""
+    t = time.strptime(nome[len(PREFISSO_PARTIZIONE):], "%Y%m%d")
+    return calendar.timegm(t) // 86400
+
+
+def crea_partizione(conn, giorno):
+    """Creates (if needed) the raw partition of day giorno, returns its name."""
+    nome = nome_partizione(giorno)
+    conn.execute("CREATE TABLE IF NOT EXISTS `%s` ("
+                 "`ID_Coordinate` INTEGER PRIMARY KEY, "
+                 "`X` REAL NOT NULL, `Y` REAL NOT NULL, `Z` REAL NOT NULL, "
+                 "`Nome_Componente` TEXT NOT NULL, `Timestamp` REAL)" % nome)
+    conn.execute("CREATE INDEX IF NOT EXISTS `%s_Componente_Timestamp` "
+                 "ON `%s` (Nome_Componente, Timestamp)" % (nome, nome))
+    return nome
+
+
+def partizioni(conn):
+    """Returns {day: table name} of the existing raw partitions."""
+    nomi = [r[0] for r in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type='table' AND name GLOB ?",
+        (PREFISSO_PARTIZIONE + "[0-9]*",))]
+    return dict((giorno_partizione(n), n) for n in nomi)
+
+
+def version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(path):
+    """
+    Brings the database at path to SCHEMA_VERSION.
+    Returns (version before, version after).
+    """
+    conn = sqlite3.connect(path)
+    # transactions are managed explicitly: the PRAGMA must commit together
+    # with the migration it records
+    conn.isolation_level = None
+    try:
+        prima = version(conn)
+        if prima > SCHEMA_VERSION:
+            raise RuntimeError("%s has schema version %d, newer than %d"
+                               % (path, prima, SCHEMA_VERSION))
+        for v in range(prima, SCHEMA_VERSION):
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                MIGRAZIONI[v](conn)
+                conn.execute("PRAGMA user_version=%d" % (v + 1))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        conn.execute("ANALYZE")
+        return prima, version(conn)
+    finally:
+        conn.close()
@@ -1,10 +1,144 @@
-from sklearn import svm
-from sklearn.externals import joblib
 import tornado.ioloop
 import tornado.web
-import sqlite3
+from tornado import gen
 import json
-from calcoloArea import calcoloFeatures
+import os
+import time
+import numpy as np
+import feature_pool
+import schema
+from database import Database
+from sample_buffer import SampleStore
+from push import Hub, pushDati
+from flotta import StatoFlotta
+from scheduler import Scheduler
+from calcoloArea import FS, DECOMPOSIZIONE
+import decomposizione as dec
+import wire
+
+def perAsse(decomposizione):
+    """
+    True if the axes of a component are worth a task each: there are
+    fewer components than workers, which would otherwise stay idle, and
+    the backend decomposes the axes separately.
+    """
+    multicanale=dec.BACKENDS[decomposizione or DECOMPOSIZIONE].multicanale
+    return len(store.components())<workers and not multicanale
+
+async def classifica(dataX,dataY,dataZ,decomposizione=None,cuscinetto=None,flusso=None):
+    """
+    Extracts the features of the three axes and classifies them on the
+    process pool: one task per axis plus one for the prediction if
+    perAsse, else a single task (different components still run in
+    parallel). Returns (label index, confidence), see
+    feature_pool.predict_confidenza.
+    decomposizione: backend of the IMF stage (see decomposizione.py)
+    cuscinetto: bearing of the component (see cuscinetto.py)
+    flusso: (component, seq) of the window, see decomposizione.Decomposizione.imf
+    The CPU time of the decompositions is added to costi.
+    """
+    loop=tornado.ioloop.IOLoop.current()
+    xyz=np.vstack((dataX,dataY,dataZ))
+    if perAsse(decomposizione):
+        assi=await gen.multi([loop.run_in_executor(executor,feature_pool.features_asse,asse,decomposizione,cuscinetto,
+                                                   dec.canale(flusso,a))
+                              for a,asse in enumerate(xyz)])
+        for _,costo in assi:
+            costi.aggiungi(costo)
+        return await loop.run_in_executor(executor,feature_pool.predict_confidenza,np.concatenate([f for f,_ in assi]))
+    indice,confidenza,costo=await loop.run_in_executor(executor,feature_pool.classifica_sensore,xyz,decomposizione,cuscinetto,flusso)
+    costi.aggiungi(costo)
+    return indice,confidenza
+
+async def classificaComponente(nome):
+    """
+    Classifies the newest 100 samples of component nome; run by the
+    scheduler only. Returns (label index, confidence).
+    """
+    _,seq,dataX,dataY,dataZ=store.snapshot(nome,100)
+    return await classifica(dataX,dataY,dataZ,decomposizioni.get(nome),store.bearings.get(nome),(nome,seq))
+
+def etichetta(indice):
+    """Label of a label index, SCONOSCIUTO if None (not classified)."""
+    return SCONOSCIUTO if indice is None else label[indice]
+
+def pubblicaRisultato(nome,risultato):
+    """
+    Records a new result of the scheduler in the fleet state table and
+    pushes it to the WebSocket subscribers of the component.
+    """
+    flotta.aggiorna(nome,store.sectors[nome],etichetta(risultato.indice),risultato.confidenza,risultato.istante)
+    hub.notifica(nome)
+
+async def risultatoComponente(nome):
+    """
+    Latest scheduler.Risultato of component nome, waiting at most ATTESA
+    seconds for the first one after start-up; None if there is none yet.
+    """
+    return await scheduler.attendi(nome,ATTESA)
+
+def istanteStato(risultato):
+    """istanteStato of a response: when its state was computed, or None."""
+    return None if risultato is None else risultato.istante
+
+def etichettaAttuale(nome):
+    """
+    Label of the latest classification of component nome, SCONOSCIUTO if
+    there is none yet, without waiting for it (for the push hub).
+    """
+    risultato=scheduler.risultato(nome)
+    return etichetta(None if risultato is None else risultato.indice)
+
+def finestraComponente(nome,since=0,n=200):
+    """
+    Newest n samples of component nome after ID_Coordinate since, as
+    (ids, X, Y, Z), oldest first.
+    """
+    if nome not in store.buffers:
+        # registered in Componente, no samples yet
+        vuoto=np.empty(0)
+        return vuoto.astype(np.int64),vuoto,vuoto,vuoto
+    ids,dataX,dataY,dataZ=store.since(nome,since)
+    return ids[-n:],dataX[-n:],dataY[-n:],dataZ[-n:]
+
+def intervalloComponente(nome,inizio,fine):
+    """
+    Samples of component nome with inizio <= Timestamp <= fine, as (ids,
+    X, Y, Z), oldest first; read from the database (run it on the
+    database threads, see Database.campioni_intervallo). None if there
+    are more than MASSIMO_INTERVALLO: only that many plus one are read.
+    """
+    righe=db.campioni_intervallo(nome,inizio,fine,MASSIMO_INTERVALLO+1)
+    if len(righe)>MASSIMO_INTERVALLO:
+        return None
+    righe=np.array([r[:4] for r in righe],dtype=np.float64).reshape(-1,4)
+    return righe[:,0].astype(np.int64),righe[:,1],righe[:,2],righe[:,3]
+
+def cursore(nome,ids):
+    """Cursor of a response with the samples ids: the newest one sent."""
+    if len(ids):
+        return int(ids[-1])
+    return store.cursor(nome)[0] if nome in store.buffers else 0
+
+def scriviFinestre(handler,finestre,lista=True):
+    """
+    Writes the sample windows (dicts whose datiX, datiY and datiZ are
+    numpy arrays) as JSON, a list or only the first window if not lista,
+    or as float32 frames if the client asks for them (see wire.py).
+    """
+    handler.set_header("Vary","Accept")
+    if wire.wants_binary(handler):
+        handler.set_header("Content-Type",wire.MEDIA_TYPE)
+        handler.write(wire.encode(finestre))
+        return
+    for f in finestre:
+        for asse in ("datiX","datiY","datiZ"):
+            f[asse]=f[asse].tolist()
+    handler.write(json.dumps(finestre if lista else finestre[0]))
+
+def aggiornaStore():
+    """Fetches the new samples into store, on the database threads."""
+    return db.run(store.refresh)
 
 class dataUpdate(tornado.web.RequestHandler):
     def set_default_headers(self):
@@ -17,50 +151,60 @@ class dataUpdate(tornado.web.RequestHandler):
         self.set_status(204)
         self.finish()
 
-    def get(self):
-        self.post()
+    async def get(self):
+        await self.post()
 
-    def post(self):
+    async def post(self):
+        """
+        Newest 200 samples of component nomeComponente and its state. With
+        since (the cursore of a previous response, i.e. the last
+        ID_Coordinate seen) only the samples after it are returned, and
+        304 with no body if there are none and the state is the one of
+        the response the client passes the istanteStato of (the state
+        is classified in the background, often after its samples were
+        sent). Without istanteStato only the samples are compared.
+        """
         nome=self.get_argument("nomeComponente",True)
-        conn = sqlite3.connect('data.db')
-        c = conn.cursor()
+        since=self.get_argument("since",None)
+        istante=self.get_argument("istanteStato",None)
         """
         LOADING DATA
         """
-        c.execute("SELECT * FROM Componente INNER JOIN Coordinate ON Componente.Nome=Coordinate.Nome_Componente WHERE Componente.Nome='"+nome+"'")
-        data=c.fetchall()
-        dataZone={}
-        dataX={}
-        dataY={}
-        dataZ={}
+        await db.run(store.refresh)
+        if nome not in store.sectors:
+            raise tornado.web.HTTPError(404,"unknown component %s" % nome)
+        if since is None:
+            ids,dataX,dataY,dataZ=finestraComponente(nome)
+        else:
+            try:
+                since=int(since)
+                istante=None if istante is None else float(istante)
+            except ValueError:
+                raise tornado.web.HTTPError(400,"since must be an ID_Coordinate and istanteStato a time")
+            ids,dataX,dataY,dataZ=finestraComponente(nome,since)
+            if len(ids)==0:
+                risultato=scheduler.risultato(nome)
+                if istante is None or risultato is None or risultato.istante<=istante:
+                    # nothing new: neither the samples nor the state changed
+                    self.set_status(304)
+                    self.finish()
+                    return
         state={}
-        for d in data:
-            if (d[0] not in dataZone):
-                dataX[d[0]]=[]
-                dataY[d[0]]=[]
-                dataZ[d[0]]=[]
-            dataZone[d[0]]=d[1]
-            dataX[d[0]].append(d[3])
-            dataY[d[0]].append(d[4])
-            dataZ[d[0]].append(d[5])
-        features=[]
-        featX1,featX2,featX3,featX4,featX5,featX6=calcoloFeatures(dataX[nome][len(dataX[nome])-100:])
-        featY1,featY2,featY3,featY4,featY5,featY6=calcoloFeatures(dataY[nome][len(dataY[nome])-100:])
-        featZ1,featZ2,featZ3,featZ4,featZ5,featZ6=calcoloFeatures(dataZ[nome][len(dataZ[nome])-100:])
-        features.append([featX1,featX2,featX3,featX4,featX5,featX6,featY1,featY2,featY3,featY4,featY5,featY6,featZ1,featZ2,featZ3,featZ4,featZ5,featZ6])
-        state[nome]=clf.predict(features)
+        risultato=await risultatoComponente(nome)
+        state[nome]=None if risultato is None else risultato.indice
         print(state)
         data={
             "nome":nome,
-            "settore":dataZone[nome],
-            "datiX":dataX[nome][len(dataX[nome])-200:],
-            "datiY":dataY[nome][len(dataY[nome])-200:],
-            "datiZ":dataZ[nome][len(dataZ[nome])-200:],
-            "statoAttuale":label[state[nome][0]]
+            "settore":store.sectors[nome],
+            "cursore":cursore(nome,ids),
+            "datiX":dataX,
+            "datiY":dataY,
+            "datiZ":dataZ,
+            "statoAttuale":etichetta(state[nome]),
+            "istanteStato":istanteStato(risultato)
             }
         #print(data)
-        self.write(json.dumps(data))
-        conn.close()
+        scriviFinestre(self,[data],lista=False)
 class loadRefData(tornado.web.RequestHandler):
 	def set_default_headers(self):
 		self.set_header("Access-Control-Allow-Origin", "*")
@@ -72,55 +216,36 @@ class loadRefData(tornado.web.RequestHandler):
 		self.set_status(204)
 		self.finish()
 
-	def get(self):
-		self.post()
+	async def get(self):
+		await self.post()
 
-	def post(self):
-		conn = sqlite3.connect('data.db')
-		c = conn.cursor()
+	async def post(self):
 		"""
         LOADING DATA
         """
-		c.execute("SELECT * FROM Componente INNER JOIN Coordinate ON Coordinate.Nome_Componente='Ventola-Buona'")
-		data=c.fetchall()
-		dataZone={}
-		dataX={}
-		dataY={}
-		dataZ={}
+		refX,refY,refZ=await db.run(store.reference,'Ventola-Buona',200)
 		state={}
-		
-		for d in data:
-			if (d[0] not in dataZone):
-				dataX[d[0]]=[]
-				dataY[d[0]]=[]
-				dataZ[d[0]]=[]
-			dataZone[d[0]]=d[1]
-			dataX[d[0]].append(d[3])
-			dataY[d[0]].append(d[4])
-			dataZ[d[0]].append(d[5])
 
+		# the reference window never changes: classify it only once
+		refState=statiRiferimento.get('Ventola-Buona')
+		if refState is None:
+			refState=(await classifica(refX[100:200],refY[100:200],refZ[100:200]))[0]
+			statiRiferimento['Ventola-Buona']=refState
 
 		data=[]
-		for k in dataZone.keys():
-			features=[]
-			featX1,featX2,featX3,featX4,featX5,featX6=calcoloFeatures(dataX[k][100:200])
-			featY1,featY2,featY3,featY4,featY5,featY6=calcoloFeatures(dataY[k][100:200])
-			featZ1,featZ2,featZ3,featZ4,featZ5,featZ6=calcoloFeatures(dataZ[k][100:200])
-			features.append([featX1,featX2,featX3,featX4,featX5,featX6,featY1,featY2,featY3,featY4,featY5,featY6,featZ1,featZ2,featZ3,featZ4,featZ5,featZ6])
-			state[k]=clf.predict(features)
-
+		for k in store.components():
+			state[k]=refState
             #print(state[k][0])
 			data.append({
 				"nome":k,
-				"settore":dataZone[k],
-				"datiX":dataX[k][:200],
-				"datiY":dataY[k][:200],
-				"datiZ":dataZ[k][:200],
-				"statoAttuale":label[state[k][0]]
+				"settore":store.sectors[k],
+				"datiX":refX,
+				"datiY":refY,
+				"datiZ":refZ,
+				"statoAttuale":label[state[k]]
 			})
         #print(data)
-		self.write(json.dumps(data))
-		conn.close()
+		scriviFinestre(self,data)
 	
 class loadData(tornado.web.RequestHandler):
     def set_default_headers(self):
@@ -133,65 +258,198 @@ class loadData(tornado.web.RequestHandler):
         self.set_status(204)
         self.finish()
 
-    def get(self):
-        self.post()
+    async def get(self):
+        await self.post()
 
-    def post(self):
-        conn = sqlite3.connect('data.db')
-        c = conn.cursor()
+    async def post(self):
         """
         LOADING DATA
+        The latest window of every component, or with inizio and/or fine
+        (epoch seconds) its samples between them, read from the database:
+        400 if a component has more than MASSIMO_INTERVALLO of them.
         """
-        c.execute("SELECT * FROM Componente INNER JOIN Coordinate ON Componente.Nome=Coordinate.Nome_Componente")
-        data=c.fetchall()
-        dataZone={}
-        dataX={}
-        dataY={}
-        dataZ={}
+        try:
+            inizio=self.get_argument("inizio",None)
+            fine=self.get_argument("fine",None)
+            if inizio is not None or fine is not None:
+                inizio=float(inizio or 0)
+                fine=float(fine or time.time())
+        except ValueError:
+            raise tornado.web.HTTPError(400,"inizio and fine must be epoch seconds")
+        await db.run(store.refresh)
         state={}
 
-        for d in data:
-            if (d[0] not in dataZone):
-                dataX[d[0]]=[]
-                dataY[d[0]]=[]
-                dataZ[d[0]]=[]
-            dataZone[d[0]]=d[1]
-            dataX[d[0]].append(d[3])
-            dataY[d[0]].append(d[4])
-            dataZ[d[0]].append(d[5])
-
-
+        # latest state of every component, from the scheduler
+        componenti=store.components()
+        risultati=await gen.multi([risultatoComponente(k) for k in componenti])
+        if fine is None:
+            finestre=[finestraComponente(k) for k in componenti]
+        else:
+            finestre=await gen.multi([db.run(intervalloComponente,k,inizio,fine) for k in componenti])
+            if any(f is None for f in finestre):
+                raise tornado.web.HTTPError(400,"more than %d samples of a component between inizio and fine: "
+                                            "narrow the range or use /loadRollup" % MASSIMO_INTERVALLO)
         data=[]
-        for k in dataZone.keys():
-            features=[]
-            featX1,featX2,featX3,featX4,featX5,featX6=calcoloFeatures(dataX[k][len(dataX[k])-100:])
-            featY1,featY2,featY3,featY4,featY5,featY6=calcoloFeatures(dataY[k][len(dataY[k])-100:])
-            featZ1,featZ2,featZ3,featZ4,featZ5,featZ6=calcoloFeatures(dataZ[k][len(dataZ[k])-100:])
-            features.append([featX1,featX2,featX3,featX4,featX5,featX6,featY1,featY2,featY3,featY4,featY5,featY6,featZ1,featZ2,featZ3,featZ4,featZ5,featZ6])
-            state[k]=clf.predict(features)
+        for k,r,(ids,dataX,dataY,dataZ) in zip(componenti,risultati,finestre):
+            state[k]=None if r is None else r.indice
 
             #print(state[k][0])
             data.append({
                 "nome":k,
-                "settore":dataZone[k],
-                "datiX":dataX[k][len(dataX[k])-200:],
-                "datiY":dataY[k][len(dataY[k])-200:],
-                "datiZ":dataZ[k][len(dataZ[k])-200:],
-                "statoAttuale":label[state[k][0]]
+                "settore":store.sectors[k],
+                "cursore":cursore(k,ids),
+                "datiX":dataX,
+                "datiY":dataY,
+                "datiZ":dataZ,
+                "statoAttuale":etichetta(state[k]),
+                "istanteStato":istanteStato(r)
             })
         #print(data)
+        scriviFinestre(self,data)
+
+
+class loadRollup(tornado.web.RequestHandler):
+    def set_default_headers(self):
+        self.set_header("Access-Control-Allow-Origin", "*")
+        self.set_header("Access-Control-Allow-Headers", "x-requested-with")
+        self.set_header('Access-Control-Allow-Methods', 'POST, GET, OPTIONS')
+
+    def options(self):
+        # no body
+        self.set_status(204)
+        self.finish()
+
+    async def get(self):
+        await self.post()
+
+    async def post(self):
+        """
+        Long-range history of one component, read from the rollup tables
+        maintained by retention.py: nomeComponente, inizio and fine (epoch
+        seconds), risoluzione ('minuto' or 'ora').
+        """
+        nome=self.get_argument("nomeComponente")
+        try:
+            inizio=float(self.get_argument("inizio",0))
+            fine=float(self.get_argument("fine",time.time()))
+        except ValueError:
+            raise tornado.web.HTTPError(400,"inizio and fine must be epoch seconds")
+        risoluzione=self.get_argument("risoluzione","ora")
+        if risoluzione not in schema.TABELLE_ROLLUP:
+            raise tornado.web.HTTPError(400,"risoluzione must be one of %s" % list(schema.TABELLE_ROLLUP))
+        righe=await db.run(db.rollup,nome,inizio,fine,risoluzione)
+        colonne=["Inizio"]+schema.COLONNE_ROLLUP
+        data={
+            "nome":nome,
+            "risoluzione":risoluzione,
+            "rollup":dict((c,[r[i] for r in righe]) for i,c in enumerate(colonne))
+            }
         self.write(json.dumps(data))
-        conn.close()
+
+
+class fleetState(tornado.web.RequestHandler):
+    def set_default_headers(self):
+        self.set_header("Access-Control-Allow-Origin", "*")
+        self.set_header("Access-Control-Allow-Headers", "x-requested-with")
+        self.set_header('Access-Control-Allow-Methods', 'POST, GET, OPTIONS')
+
+    def options(self):
+        # no body
+        self.set_status(204)
+        self.finish()
+
+    def get(self):
+        self.post()
+
+    def post(self):
+        """
+        State of every component, from the fleet state table: name,
+        sector, label, confidence and time of the last classification
+        (epoch seconds). Optional settore keeps one sector; offset and
+        limite (at most 1000) select a page, ordered by sector and name.
+        """
+        settore=self.get_argument("settore",None)
+        try:
+            offset=int(self.get_argument("offset",0))
+            limite=int(self.get_argument("limite",100))
+        except ValueError:
+            raise tornado.web.HTTPError(400,"offset and limite must be integers")
+        if offset<0 or not 0<limite<=1000:
+            raise tornado.web.HTTPError(400,"offset must be >= 0 and limite in [1, 1000]")
+        totale,righe=flotta.pagina(settore,offset,limite)
+        data={
+            "totale":totale,
+            "offset":offset,
+            "limite":limite,
+            "componenti":righe
+            }
+        self.write(json.dumps(data))
+
+
+class backendStats(tornado.web.RequestHandler):
+    def set_default_headers(self):
+        self.set_header("Access-Control-Allow-Origin", "*")
+        self.set_header("Access-Control-Allow-Headers", "x-requested-with")
+        self.set_header('Access-Control-Allow-Methods', 'POST, GET, OPTIONS')
+
+    def options(self):
+        # no body
+        self.set_status(204)
+        self.finish()
+
+    def get(self):
+        self.post()
+
+    def post(self):
+        """
+        CPU time of the decompositions per backend since start-up (see
+        decomposizione.Costi): windows, mean and last ms per window.
+        """
+        self.write(json.dumps({"backend":costi.statistiche()}))
 
 
 if __name__ == "__main__":
 	label=["rotto","danneggiato","buono"]
-	clf = joblib.load('net4.pkl')
+	# state of the components not classified (yet)
+	SCONOSCIUTO="sconosciuto"
+	# seconds a request waits for the first classification of a component
+	ATTESA=10
+	# most samples per component /loadData returns for a time range;
+	# longer ranges are read from /loadRollup
+	MASSIMO_INTERVALLO=10000
+	workers = os.cpu_count() or 1
+	executor = feature_pool.create_executor('net4.pkl', max_workers=workers)
+	schema.migrate('data.db')
+	db = Database('data.db', size=4, readonly=True)
+	store = SampleStore(db, capacity=200, fs=FS)
+	# label index of the reference window of /loadRefData, classified once
+	statiRiferimento = {}
+	# backend of the IMF stage per component, e.g. {'Ventola-Buona': 'filtri'};
+	# the others use calcoloArea.DECOMPOSIZIONE
+	decomposizioni = {}
+	# CPU time of the decompositions run by the workers, for /backendStats
+	costi = dec.Costi()
+	# new samples and state changes pushed to the WebSocket clients of /push
+	hub = Hub(store, aggiornaStore, etichettaAttuale, finestra=200, intervallo=500)
+	# state of every component for /fleetState
+	flotta = StatoFlotta(SCONOSCIUTO)
+	for nome,settore in store.sectors.items():
+		flotta.registra(nome,settore)
+	# every component is classified every 25 new samples, or 5 s if fewer
+	# arrived, one per worker at a time, rotto and danneggiato first
+	scheduler = Scheduler(store, aggiornaStore, classificaComponente, pubblicaRisultato,
+		ogni_campioni=25, ogni_secondi=5.0, massimo=workers, allarme=(label.index("rotto"),label.index("danneggiato")), intervallo=500)
 	application = tornado.web.Application([
         (r"/loadData", loadData),
         (r"/dataUpdate", dataUpdate),
-        (r"/loadRefData", loadRefData)
+        (r"/loadRefData", loadRefData),
+        (r"/loadRollup", loadRollup),
+        (r"/push", pushDati, dict(hub=hub)),
+        (r"/fleetState", fleetState),
+        (r"/backendStats", backendStats)
 	])
 	application.listen(9000)
+	scheduler.start()
+	hub.start()
 	print("Starting server...")
 	tornado.ioloop.IOLoop.current().start()
@@ -0,0 +1,148 @@
+"""
+Spectral analysis of real signals (accelerometer axes).
+
+The signals are real, so only the non-negative half of their spectrum is
+computed (rfft): N//2+1 bins instead of N. The spectrum of a bin k with
+0 < k < N/2 stands for both k and N-k; pesi() gives how many bins of
+the full spectrum every bin of the half spectrum stands for, so that
+sums over the full spectrum are computed on the half one.
+
+Frequency axes, windows and band weights depend only on the window
+length N (and sample period tstep) and are cached, since the dashboard
+and the feature pipeline always see the same few lengths.
+
+Every function works on the last axis of a batch of any shape, e.g.
+(components, axes, samples):
+
+    freqs, ps, fondamentale, energie = analizza(segnali, tstep, bande)
+
+utils.compute_fft and friends return the full spectrum sorted by
+frequency, as they always did (see completo()).
+"""
+import numpy as np
+from scipy import fft
+from scipy.signal import get_window
+
+_frequenze = {}
+_frequenzeComplete = {}
+_pesi = {}
+_finestre = {}
+_pesiBande = {}
+
+
+def _costante(a):
+    a.setflags(write=False)
+    return a
+
+
+def frequenze(N, tstep=1.0):
+    """Frequencies of the N//2+1 bins of the half spectrum (cached)."""
+    key = (N, tstep)
+    if key not in _frequenze:
+        _frequenze[key] = _costante(np.fft.rfftfreq(N, tstep))
+    return _frequenze[key]
+
+
+def frequenzeComplete(N, tstep=1.0):
+    """Frequencies of the full spectrum in ascending order (cached)."""
+    key = (N, tstep)
+    if key not in _frequenzeComplete:
+        _frequenzeComplete[key] = _costante(np.fft.fftshift(np.fft.fftfreq(N, tstep)))
+    return _frequenzeComplete[key]
+
+
+def pesi(N):
+    """Number of bins of the full spectrum every bin of the half one stands for."""
+    if N not in _pesi:
+        p = np.full(N // 2 + 1, 2.0)
+        p[0] = 1.0
+        if N % 2 == 0:
+            p[-1] = 1.0
+        _pesi[N] = _costante(p)
+    return _pesi[N]
+
+
+def coefficientiFinestra(N, nome):
+    """scipy.signal.get_window(nome, N) (cached)."""
+    key = (N, nome)
+    if key not in _finestre:
+        _finestre[key] = _costante(get_window(nome, N))
+    return _finestre[key]
+
+
+def pesiBande(N, tstep, bande):
+    """
+    Matrix (N//2+1, bands) summing the full spectrum over every band
+    (lo, hi) of bande, in Hz with both ends included (cached).
+    """
+    bande = tuple((float(lo), float(hi)) for lo, hi in bande)
+    key = (N, tstep, bande)
+    if key not in _pesiBande:
+        f = frequenze(N, tstep)
+        M = np.zeros((len(f), len(bande)))
+        for j, (lo, hi) in enumerate(bande):
+            M[:, j] = pesi(N) * ((f >= lo) & (f <= hi))
+        _pesiBande[key] = _costante(M)
+    return _pesiBande[key]
+
+
+def potenza(segnali, finestra=None, normalizza=True):
+    """
+    Power spectrum |X_k|**2 of the half spectrum of segnali, along the
+    last axis. normalizza divides X by N (as utils.compute_fft).
+    float32 signals are transformed in single precision.
+    finestra: name of a window (see scipy.signal.get_window), or None
+    """
+    segnali = np.asarray(segnali)
+    if segnali.dtype != np.float32:
+        segnali = segnali.astype(np.float64)
+    N = segnali.shape[-1]
+    if finestra is not None:
+        segnali = segnali * coefficientiFinestra(N, finestra).astype(segnali.dtype)
+    X = fft.rfft(segnali, axis=-1)
+    if normalizza:
+        X /= N
+    return X.real ** 2 + X.imag ** 2
+
+
+def area(ps, N):
+    """
+    Trapezoidal area (numpy.trapz) of the full spectrum of N samples,
+    from the power ps of its half (last axis).
+    """
+    return np.dot(ps, pesi(N).astype(ps.dtype)) - (ps[..., 0] + ps[..., 1]) / 2
+
+
+def fondamentale(ps, N, tstep=1.0):
+    """Frequency of the bin with the highest power (last axis)."""
+    return frequenze(N, tstep)[np.argmax(ps, axis=-1)]
+
+
+def energie(ps, N, tstep, bande):
+    """Energy of the full spectrum in every band: shape (..., bands)."""
+    return np.dot(ps, pesiBande(N, tstep, bande))
+
+
+def completo(ps, N):
+    """
+    Full spectrum of N samples, in the order of frequenzeComplete(),
+    from the power ps of its half (last axis).
+    """
+    return np.concatenate((ps[..., 1:N // 2 + 1][..., ::-1], ps[..., :(N + 1) // 2]), axis=-1)
+
+
+def analizza(segnali, tstep, bande=(), finestra=None):
+    """
+    One pass over a batch of signals (last axis: samples).
+
+    Returns freqs, ps, fondamentale, energie:
+        freqs         frequencies of the half spectrum (N//2+1,)
+        ps            normalized power of the half spectrum (..., N//2+1)
+        fondamentale  frequency of maximum power (...)
+        energie       energy of the full spectrum in every band of
+                      bande, (lo, hi) pairs in Hz: (..., len(bande))
+    """
+    ps = potenza(segnali, finestra)
+    N = np.shape(segnali)[-1]
+    return (frequenze(N, tstep), ps, fondamentale(ps, N, tstep),
+            energie(ps, N, tstep, bande))
@@ -0,0 +1,49 @@
+"""
+Regression test of the features the classifier (net4.pkl) was trained
+on: calcoloFeatures on stored windows of the dataset gives the values of
+the original implementation.
+
+    python -m pytest test_calcoloArea.py
+"""
+import os
+
+import numpy as np
+import pytest
+
+from calcoloArea import calcoloFeatures, calcoloFeatures_batch
+
+# samples 100-199 of dataset/<file>.csv, axis (0: X, 1: Y, 2: Z), and the
+# six features computed by the calcoloFeatures of the first commit
+ORIGINALI = [
+    ('A', 0, [0.6762341213744439, 0.7143928183241826, 0.9737488422814707, 0.0006858906355716394, 0.00041210622530327005, 0.0]),
+    ('A', 1, [0.38725657626883764, 0.4473550131029692, 0.9605379310759053, 0.0008606995203376954, 0.0005197617085624764, 0.0]),
+    ('A', 2, [0.9924294224527741, 0.9956206002537162, 0.9991946016494639, 0.00252456727071418, 0.0029049576819260383, 0.0021795516111923754]),
+    ('C', 0, [0.831901977471883, 0.8963207477377614, 0.9797707905371104, 0.0, 0.0, 0.0]),
+    ('C', 1, [0.7331759745303574, 0.7784112294457807, 0.841108658664524, 0.0015212319214539841, 0.0011593922548695905, 0.0007021749721066017]),
+    ('C', 2, [0.9723884934218548, 0.9773327566772425, 0.9908283038708775, 0.0008538053455641914, 0.0006260367473240767, 0.0004691083207227962]),
+    ('E', 0, [0.8866641478256336, 0.9103507443207528, 0.9721773499689993, 0.0003552472636716269, 0.000178571660263667, 0.00037056579652282453]),
+    ('E', 1, [0.8337473400447107, 0.8643224513097503, 0.9700910591221185, 0.0003967870301110358, 0.0004123597878392118, 0.0004643641009049422]),
+    ('E', 2, [0.9921755151287999, 0.9955028485279382, 0.9990492138998401, 0.0004820003241918059, 0.0015197296333978472, 0.0026481934885270474]),
+]
+
+
+def _finestra(nome):
+    percorso = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dataset', '%s.csv' % nome)
+    return np.loadtxt(percorso, delimiter=',')[100:200, 1:4].T
+
+
+@pytest.mark.parametrize('nome, asse, attese', ORIGINALI)
+def test_come_originale(nome, asse, attese):
+    # the spectral areas are computed in another precision, the maxima of
+    # the marginal Hilbert spectra are the same
+    features = calcoloFeatures(_finestra(nome)[asse])
+    np.testing.assert_allclose(features[:3], attese[:3], rtol=1e-6)
+    np.testing.assert_allclose(features[3:], attese[3:], rtol=1e-9, atol=1e-15)
+
+
+@pytest.mark.parametrize('nome', ['A', 'C', 'E'])
+def test_batch_come_originale(nome):
+    attese = [a for n, _, a in ORIGINALI if n == nome]
+    features = calcoloFeatures_batch(_finestra(nome))[0].reshape(3, 6)
+    np.testing.assert_allclose(features[:, :3], np.array(attese)[:, :3], rtol=1e-6)
+    np.testing.assert_allclose(features[:, 3:], np.array(attese)[:, 3:], rtol=1e-9, atol=1e-15)
@@ -0,0 +1,81 @@
+"""
+Tests of the sample reads of database.py on a fresh data.db: the query
+plans use the indexes of schema version 1, and campioni_intervallo
+reads Coordinate and the daily partitions of the range.
+
+    python -m pytest test_database.py
+"""
+import sqlite3
+
+import pytest
+
+import database
+import schema
+
+GIORNO = 17931  # 2019-02-04, days since the epoch
+
+
+@pytest.fixture
+def percorso(tmp_path):
+    path = str(tmp_path / 'data.db')
+    schema.migrate(path)
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute("INSERT INTO Componente (Nome, Sezione) VALUES ('Ventola', 'k')")
+        # the day before in its partition, as retention.py leaves it
+        partizione = schema.crea_partizione(conn, GIORNO - 1)
+        conn.executemany("INSERT INTO `%s` VALUES (?, ?, ?, ?, 'Ventola', ?)" % partizione,
+                         [(i, i, -i, 0.5 * i, (GIORNO - 1) * 86400 + 3600 * i) for i in range(1, 11)])
+        conn.executemany("INSERT INTO Coordinate (ID_Coordinate, X, Y, Z, Nome_Componente, Timestamp) "
+                         "VALUES (?, ?, ?, ?, ?, ?)",
+                         [(i, i, -i, 0.5 * i, 'Ventola', GIORNO * 86400 + 60 * (i - 10))
+                          for i in range(11, 1011)] +
+                         [(i, 0, 0, 0, 'Altra', GIORNO * 86400 + 60 * (i - 1010))
+                          for i in range(1011, 2011)])
+        conn.execute("ANALYZE")
+    conn.close()
+    return path
+
+
+def _piano(path, sql, params):
+    conn = sqlite3.connect(path)
+    try:
+        return " ".join(r[-1] for r in conn.execute("EXPLAIN QUERY PLAN " + sql, params))
+    finally:
+        conn.close()
+
+
+def test_ultimi_campioni_indice_coprente(percorso):
+    piano = _piano(percorso, database.SQL_ULTIMI_CAMPIONI, ('Ventola', 200))
+    assert 'COVERING INDEX Coordinate_Componente_ID' in piano
+    assert 'TEMP B-TREE' not in piano
+
+
+def test_campioni_intervallo_indice(percorso):
+    piano = _piano(percorso, database.SQL_CAMPIONI_INTERVALLO % 'Coordinate', ('Ventola', 0, 1, -1))
+    assert 'INDEX Coordinate_Componente_Timestamp' in piano
+    assert 'TEMP B-TREE' not in piano
+
+
+def test_campioni_intervallo(percorso):
+    db = database.Database(percorso, size=1)
+    try:
+        # from the last 3 hours of the partition to the first 5 minutes of Coordinate
+        righe = db.campioni_intervallo('Ventola', (GIORNO - 1) * 86400 + 3600 * 8, GIORNO * 86400 + 300)
+        assert [r[0] for r in righe] == [8, 9, 10, 11, 12, 13, 14, 15]
+        assert righe[0][1:4] == (8.0, -8.0, 4.0)
+        assert db.campioni_intervallo('Ventola', 0, 1) == []
+    finally:
+        db.close()
+
+
+def test_campioni_intervallo_limite(percorso):
+    db = database.Database(percorso, size=1)
+    try:
+        tutto = ((GIORNO - 1) * 86400, GIORNO * 86400 + 86399)
+        # the partition first, then Coordinate, in timestamp order
+        assert [r[0] for r in db.campioni_intervallo('Ventola', *tutto, limite=12)] == list(range(1, 13))
+        assert len(db.campioni_intervallo('Ventola', *tutto, limite=5)) == 5
+        assert len(db.campioni_intervallo('Ventola', *tutto, limite=2000)) == 1010
+    finally:
+        db.close()
@@ -0,0 +1,80 @@
+"""
+Property test of detect_peaks and detect_peaks_batch: on random signals
+and options they return exactly the peaks of the original detect_peaks
+1.0.4 (detect_peaks_104.py). utils.compute_data_for_spectrum
+finds the same peaks on a batch as on every signal alone.
+
+    python -m pytest test_detect_peaks.py
+"""
+import numpy as np
+import pytest
+
+import detect_peaks
+import utils
+from detect_peaks_104 import detect_peaks as _detect_peaks_originale
+
+
+def _caso(rng):
+    """
+    Short signals of few distinct levels (plateaus and peaks of the same
+    height), with NaN's, inf's and noise, and a random set of options.
+    """
+    n = rng.randint(0, 60)
+    X = rng.randint(0, rng.randint(2, 8), size=(rng.randint(1, 4), n)).astype(np.float64)
+    if rng.rand() < 0.3:
+        X[rng.rand(*X.shape) < 0.1] = np.nan
+    if rng.rand() < 0.1:
+        X[rng.rand(*X.shape) < 0.05] = np.inf
+    if rng.rand() < 0.3:
+        X += 0.01 * rng.randn(*X.shape)
+    opzioni = dict(mph=rng.choice([None, 1, 2.5]),
+                   mpd=rng.choice([1, 2, 3, 5, 2.5, 10, 100]),
+                   threshold=rng.choice([0, 0.5, 1]),
+                   edge=rng.choice([None, 'rising', 'falling', 'both']),
+                   kpsh=bool(rng.randint(2)), valley=bool(rng.randint(2)))
+    return X, opzioni
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_come_originale(seed):
+    rng = np.random.RandomState(seed)
+    for _ in range(500):
+        X, opzioni = _caso(rng)
+        batch = detect_peaks.detect_peaks_batch(X, **opzioni)
+        for x, ind in zip(X, batch):
+            atteso = _detect_peaks_originale(x, **opzioni)
+            np.testing.assert_array_equal(detect_peaks.detect_peaks(x, **opzioni), atteso,
+                                          err_msg=repr((x, opzioni)))
+            np.testing.assert_array_equal(ind, atteso, err_msg=repr((x, opzioni)))
+
+
+@pytest.mark.parametrize('kpsh', [False, True])
+def test_spettro_lungo(kpsh):
+    # power spectrum of a noisy signal: thousands of local maxima
+    rng = np.random.RandomState(0)
+    ps = np.abs(np.fft.rfft(rng.randn(2 * 10 ** 4)))[:10 ** 4] ** 2
+    np.testing.assert_array_equal(detect_peaks.detect_peaks(ps, mpd=5, kpsh=kpsh),
+                                  _detect_peaks_originale(ps, mpd=5, kpsh=kpsh))
+
+
+def test_mph_per_riga():
+    rng = np.random.RandomState(0)
+    X = rng.rand(8, 50)
+    mph = rng.rand(8)
+    for x, m, ind in zip(X, mph, detect_peaks.detect_peaks_batch(X, mph=mph, mpd=3)):
+        np.testing.assert_array_equal(ind, detect_peaks.detect_peaks(x, mph=m, mpd=3))
+
+
+def test_compute_data_for_spectrum_batch():
+    rng = np.random.RandomState(0)
+    X = rng.randn(2, 3, 128)
+    f, ps, picchi_f, picchi_v, fondamentali = utils.compute_data_for_spectrum(X, 0.02)
+    for i, x in enumerate(X.reshape(-1, 128)):
+        f1, ps1, pf1, pv1, ff1 = utils.compute_data_for_spectrum(x, 0.02)
+        np.testing.assert_array_equal(f, f1)
+        np.testing.assert_array_equal(ps.reshape(-1, 128)[i], ps1)
+        np.testing.assert_array_equal(picchi_f[i], pf1)
+        np.testing.assert_array_equal(picchi_v[i], pv1)
+        assert fondamentali.ravel()[i] == ff1
+        # as the original, with max(v_ps)/4 as mph
+        np.testing.assert_array_equal(pf1, f1[_detect_peaks_originale(ps1, mph=max(ps1) / 4.0)])
@@ -0,0 +1,31 @@
+"""
+EEMD.eemd gives the same ensemble, for a given seed, whether its trials
+run one after the other or on a pool of threads sharing its EMD.
+
+    python -m pytest test_eemd.py
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from EEMD import EEMD
+
+
+@pytest.mark.parametrize('complementary', [False, True])
+def test_thread_pool_come_seriale(complementary):
+    rng = np.random.RandomState(0)
+    n = 200
+    timeLine = np.linspace(0, 1, n)
+    S = np.sin(2 * np.pi * 7 * timeLine) + 0.5 * np.sin(2 * np.pi * 31 * timeLine) + 0.1 * rng.randn(n)
+    eemd = EEMD()
+    eemd.trials = 16
+    eemd.seed = 1234
+    eemd.complementary = complementary
+    seriale = eemd.eemd(S, timeLine)
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        for _ in range(3):
+            parallelo = eemd.eemd(S, timeLine, executor=executor)
+            assert parallelo[3] == seriale[3]
+            np.testing.assert_array_equal(parallelo[0], seriale[0])
+            np.testing.assert_array_equal(parallelo[2], seriale[2])
@@ -0,0 +1,92 @@
+"""
+SampleStore.refresh queries the database without holding the lock of
+the readers, and concurrent refreshes append every sample once.
+
+    python -m pytest test_sample_buffer.py
+"""
+import sqlite3
+import threading
+
+import numpy as np
+import pytest
+
+import database
+import schema
+from sample_buffer import SampleStore
+
+
+class DatabaseLento(database.Database):
+    """Database whose fetchall waits for `via` once `ferma` is set."""
+
+    def __init__(self, *args, **kwargs):
+        database.Database.__init__(self, *args, **kwargs)
+        self.ferma = threading.Event()
+        self.in_attesa = threading.Event()
+        self.via = threading.Event()
+
+    def fetchall(self, sql, params=()):
+        if self.ferma.is_set():
+            self.in_attesa.set()
+            self.via.wait(10)
+        return database.Database.fetchall(self, sql, params)
+
+
+def _inserisci(path, ids, nome='Ventola'):
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.executemany("INSERT INTO Coordinate (ID_Coordinate, X, Y, Z, Nome_Componente) "
+                         "VALUES (?, ?, ?, ?, ?)", [(i, i, -i, 0.5 * i, nome) for i in ids])
+    conn.close()
+
+
+@pytest.fixture
+def percorso(tmp_path):
+    path = str(tmp_path / 'data.db')
+    schema.migrate(path)
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute("INSERT INTO Componente (Nome, Sezione) VALUES ('Ventola', 'k')")
+        conn.execute("INSERT INTO Componente (Nome, Sezione) VALUES ('Nuova', 'k')")
+    conn.close()
+    _inserisci(path, range(1, 11))
+    return path
+
+
+def test_lettori_non_attendono_il_database(percorso):
+    db = DatabaseLento(percorso, size=2)
+    try:
+        store = SampleStore(db, capacity=50)
+        _inserisci(percorso, range(11, 16))
+        db.ferma.set()
+        t = threading.Thread(target=store.refresh)
+        t.start()
+        assert db.in_attesa.wait(10)
+        # refresh is stuck in the query: the readers go on
+        assert store.cursor('Ventola') == (10, 10)
+        assert len(store.since('Ventola', 0)[0]) == 10
+        db.via.set()
+        t.join(10)
+        assert store.cursor('Ventola') == (15, 15)
+    finally:
+        db.via.set()
+        db.close()
+
+
+def test_refresh_concorrenti(percorso):
+    db = database.Database(percorso, size=4)
+    try:
+        store = SampleStore(db, capacity=500)
+        _inserisci(percorso, range(11, 211))
+        _inserisci(percorso, range(211, 231), nome='Nuova')
+        threads = [threading.Thread(target=store.refresh) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(10)
+        ids, X, _, _ = store.since('Ventola', 0)
+        np.testing.assert_array_equal(ids, np.arange(1, 211))
+        np.testing.assert_array_equal(X, np.arange(1, 211))
+        assert store.cursor('Nuova') == (230, 20)
+        assert store.refresh() == 0
+    finally:
+        db.close()
@@ -0,0 +1,40 @@
+"""
+Tests of the binary format of wire.py: frames decode to the windows
+encoded, and only an explicit Accept of MEDIA_TYPE selects it.
+
+    python -m pytest test_wire.py
+"""
+import numpy as np
+import pytest
+
+import wire
+
+
+def test_andata_e_ritorno():
+    rng = np.random.RandomState(0)
+    finestre = [{"nome": "Ventola-%d" % i, "settore": "k", "cursore": i,
+                 "datiX": rng.randn(k), "datiY": rng.randn(k), "datiZ": rng.randn(k)}
+                for i, k in enumerate((0, 1, 7, 200))]
+    frame = wire.decode(wire.encode(finestre))
+    assert len(frame) == len(finestre)
+    for f, (header, X, Y, Z) in zip(finestre, frame):
+        assert header == {"nome": f["nome"], "settore": "k", "cursore": f["cursore"],
+                          "campioni": len(f["datiX"])}
+        for asse, dati in zip(("datiX", "datiY", "datiZ"), (X, Y, Z)):
+            np.testing.assert_array_equal(dati, f[asse].astype(np.float32))
+
+
+@pytest.mark.parametrize('accept, binario', [
+    ('application/octet-stream', True),
+    ('Application/Octet-Stream', True),
+    ('application/json, application/octet-stream', True),
+    ('application/octet-stream;q=0.5, application/json;q=0.9', False),
+    ('application/json;q=0.5, application/octet-stream', True),
+    ('application/octet-stream;q=0', False),
+    ('application/octet-stream; q=0.0', False),
+    ('application/octet-stream-foo', False),
+    ('*/*', False),
+    ('', False),
+])
+def test_accept(accept, binario):
+    assert wire.accetta_binario(accept) is binario
@@ -2,7 +2,8 @@ from sklearn import svm
 from sklearn.externals import joblib
 from sklearn.metrics import accuracy_score
 from sklearn.model_selection import train_test_split
-from calcoloArea import calcoloFeatures
+from calcoloArea import calcoloFeatures_batch, FS
+import cuscinetto
 import numpy as np
 import sqlite3
 
@@ -31,7 +32,7 @@ def loaddatabase(filename):
     clf=svm.SVC()
     conn = sqlite3.connect(filename)
     c = conn.cursor()
-    c.execute("SELECT * FROM Componente INNER JOIN Coordinate ON Componente.Nome=Coordinate.Nome_Componente")
+    c.execute("SELECT Componente.Nome, X, Y, Z FROM Componente INNER JOIN Coordinate ON Componente.Nome=Coordinate.Nome_Componente")
     data=c.fetchall()
     dataX={}
     dataY={}
@@ -42,35 +43,32 @@ def loaddatabase(filename):
             dataX[d[0]]=[]
             dataY[d[0]]=[]
             dataZ[d[0]]=[]
-        dataX[d[0]].append(d[3])
-        dataY[d[0]].append(d[4])
-        dataZ[d[0]].append(d[5])
+        dataX[d[0]].append(d[1])
+        dataY[d[0]].append(d[2])
+        dataZ[d[0]].append(d[3])
+    c.execute("SELECT Nome, %s FROM Componente" % ", ".join(cuscinetto.COLONNE))
+    cuscinetti=dict((r[0],cuscinetto.daRiga(r[1:],FS,r[0])) for r in c.fetchall())
 
 
     data=[]
     stats=[]
     features=[]
     for k in dataX.keys():
+        finestre=[]
         for i in range(1,int(len(dataX[k])/100)-1):
-            print("Dataset n."+str(i))
             tempx=dataX[k][(i-1)*100:i*100]
             tempy=dataY[k][(i-1)*100:i*100]
             tempz=dataZ[k][(i-1)*100:i*100]
-
-            featX1,featX2,featX3,featX4,featX5,featX6=calcoloFeatures(tempx)
-            featY1,featY2,featY3,featY4,featY5,featY6=calcoloFeatures(tempy)
-            featZ1,featZ2,featZ3,featZ4,featZ5,featZ6=calcoloFeatures(tempz)
-            features.append([featX1,featX2,featX3,featX4,featX5,featX6,featY1,featY2,featY3,featY4,featY5,featY6,featZ1,featZ2,featZ3,featZ4,featZ5,featZ6])
-            print("Feature di X:")
-            print(featX1,featX2,featX3,featX4,featX5,featX6)
-            print("Feature di Y:")
-            print(featY1,featY2,featY3,featY4,featY5,featY6)
-            print("Feature di Z:")
-            print(featZ1,featZ2,featZ3,featZ4,featZ5,featZ6)
-            if(k=="Ventola-Buona"):
-                stats.append(2)
-            elif(k=="Ventola-Rotta"):
-                stats.append(0)
+            finestre.append([tempx,tempy,tempz])
+        print("Componente "+k+": "+str(len(finestre))+" dataset")
+        if not finestre:
+            continue
+        featK=calcoloFeatures_batch(finestre,cuscinetto=cuscinetti.get(k))
+        features.extend(featK.tolist())
+        if(k=="Ventola-Buona"):
+            stats.extend([2]*len(featK))
+        elif(k=="Ventola-Rotta"):
+            stats.extend([0]*len(featK))
     print(len(features),len(stats))
     X_train, X_test, y_train, y_test = train_test_split(
     features, stats, test_size=0.20, random_state=42)
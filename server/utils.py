@@ -9,6 +9,7 @@ from scipy.signal import csd, butter, lfilter, filtfilt, freqz, periodogram, hil
 from scipy import interpolate
 
 import detect_peaks as dp
+import spettro
 
 import logging
 
@@ -24,14 +25,14 @@ def compute_fft(vibsig, tstep):
     v_freqs, v_ps, f_freq: the frequencies and the power spectrum for
                    the given signal
 
+    The spectrum is computed by spettro.analizza (rfft of the real
+    signal) and unfolded to both signs of the frequency. vibsig can
+    also be a batch of signals (last axis: samples).
     """
-    v_sp = np.fft.fft(vibsig)/len(vibsig) # The normalized FFT
-    v_ps = np.abs(v_sp)**2 # The power spectrum
-    v_freqs = np.fft.fftfreq(len(vibsig), tstep) # The frequency bins
-    v_idx = np.argsort(v_freqs)
-    fidx = np.argmax(v_ps)
-    f_freq = abs(v_freqs[fidx])
-    return v_freqs[v_idx], v_ps[v_idx], f_freq
+    vibsig = np.asarray(vibsig, dtype=np.float64)
+    N = vibsig.shape[-1]
+    _, v_ps, f_freq, _ = spettro.analizza(vibsig, tstep)
+    return spettro.frequenzeComplete(N, tstep), spettro.completo(v_ps, N), f_freq
 
 def compute_ifft(vibsig_re, vibsig_im, half=True):
     """Computes the IFFT
@@ -109,7 +110,7 @@ def compute_fundamental_frequency(vibsig, tstep):
     freq: the fundamental frequency of the input signal
 
     """
-    _, _, freq = compute_fft(vibsig, tstep)
+    _, _, freq, _ = spettro.analizza(np.asarray(vibsig, dtype=np.float64), tstep)
     return freq
 
 def compute_data_for_spectrum(vibsig, tstep):
@@ -118,12 +119,20 @@ def compute_data_for_spectrum(vibsig, tstep):
     spectrum (first and second return elements), and (f, v)
     corresponding to the peaks (thrid and fourth return elements).
     The last argument is the fundamental frequency of the input signal.
+
+    vibsig can also be a batch of signals (last axis: samples), as for
+    compute_fft: the peaks of all the spectra are detected in one
+    detect_peaks_batch call, and the third and fourth elements are then
+    lists with the arrays of every signal, in the order of
+    numpy.reshape(vibsig, (-1, N)).
     """
     f_freqs, v_ps, f_freq = compute_fft(vibsig, tstep)
-    mph = max(v_ps)/4.0
-    pidx = dp.detect_peaks(v_ps, mph=mph)
-    f_p_v = v_ps[pidx]
-    f_p_f = f_freqs[pidx]
+    spettri = v_ps.reshape(-1, v_ps.shape[-1])
+    picchi = dp.detect_peaks_batch(spettri, mph=spettri.max(axis=-1)/4.0)
+    f_p_v = [ps[pidx] for ps, pidx in zip(spettri, picchi)]
+    f_p_f = [f_freqs[pidx] for pidx in picchi]
+    if v_ps.ndim == 1:
+        return f_freqs, v_ps, f_p_f[0], f_p_v[0], f_freq
     return f_freqs, v_ps, f_p_f, f_p_v, f_freq
 
 def interp(x, y, oob_extrapolate=False):
@@ -145,38 +154,43 @@ def interp(x, y, oob_extrapolate=False):
         f = interpolate.interp1d(x, y, fill_value=(0.0, 0.0), bounds_error=False, kind=kind)
     return f
 
-def mhs(amplitude, freq, phase=None, plot=False):
+def mhs(amplitude, freq, phase=None, plot=False, bins=None):
     """
     amplitude: is the hilbert spectrum amplitude signal
                resulting from hilbert transformation
     freq: is the instantaneous frequency resulting
                from hilbert transformation
+    bins: if None, every distinct value in freq is a frequency
+               component. Otherwise the frequencies are accumulated
+               in a fixed histogram: bins is either the number of
+               equal-width bins or the sequence of bin edges (as
+               in numpy.histogram). Values outside the edges are
+               discarded.
 
     returns A, F where A is the sum of the contribution
                  of each frequency component in the freq
                  vector for all time points, and F is the
-                 frequency axis where to interpret A.
+                 frequency axis where to interpret A (the bin
+                 centers when bins is given).
+
+    The aggregation is sort based (numpy.unique + bincount), so
+    the cost is O(n log n) in the number of time points. Since
+    freq is usually one sample shorter than amplitude (it comes
+    from np.diff of the phase), only the first len(freq) values
+    of amplitude are used.
     """
-    f = np.array(freq)
-    HS = np.array(amplitude)
-    Atemp = []
-    F = []
-    i = 1
-    while f.size != 0:
-        # indx = [i for i,v in enumerate(f) if v = f[0]]
-        indx = np.argwhere(f == f[0]).flatten()
-        F += [f[0]]
-        Atemp += [np.sum(HS[indx])]
-        HS[indx] = 0
-        f[indx] = 0;
-        HS = HS[HS != 0]
-        f = f[f != 0]
-        i = i + 1
-
-    F = np.array(F)
-    indx = np.argsort(F)
-    F = F[indx]
-    A = np.array(Atemp)[indx]
+    f = np.asarray(freq, dtype=np.float64).ravel()
+    HS = np.asarray(amplitude, dtype=np.float64).ravel()[:f.size]
+    if HS.size != f.size:
+        raise ValueError('amplitude must have at least as many values as freq')
+
+    if bins is None:
+        F, inverse = np.unique(f, return_inverse=True)
+        A = np.bincount(inverse.ravel(), weights=HS, minlength=F.size)
+    else:
+        A, edges = np.histogram(f, bins=bins, weights=HS)
+        F = 0.5 * (edges[1:] + edges[:-1])
+
     if plot:
         import matplotlib.pyplot as plt
         plt.subplot(4, 1, 1)
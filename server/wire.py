@@ -0,0 +1,126 @@
+"""
+Binary encoding of the sample windows served by server.py.
+
+JSON spends most of a response on printing and parsing floats. A client
+asking for this format (`Accept: application/octet-stream`, or the
+query parameter formato=binario) gets the same windows as consecutive
+frames of little-endian values:
+
+    offset  size  content
+    0       4     b'UNBK'
+    4       2     uint16 format version (1)
+    6       2     uint16 n: bytes of the JSON header
+    8       n     JSON header, e.g. {"nome": ..., "settore": ...,
+                  "statoAttuale": ..., "cursore": ..., "campioni": k},
+                  padded with spaces to a multiple of 4 bytes
+    8+n     4k    X, float32
+    8+n+4k  4k    Y, float32
+    8+n+8k  4k    Z, float32
+
+The arrays start at multiples of 4 bytes, so the browser reads them in
+place:
+
+    var n = new DataView(buffer, offset).getUint16(6, true);
+    var header = JSON.parse(new TextDecoder().decode(
+        new Uint8Array(buffer, offset + 8, n)));
+    var k = header.campioni, start = offset + 8 + n;
+    var dataX = new Float32Array(buffer, start, k);
+    ...
+    offset = start + 12 * k;  // next frame
+
+The samples are converted to float32 straight into one buffer holding
+all the frames, with no per-value Python objects; the buffer is then
+copied once into the bytes Tornado's RequestHandler.write needs.
+"""
+import json
+import struct
+
+import numpy as np
+
+MAGIC = b'UNBK'
+VERSION = 1
+MEDIA_TYPE = 'application/octet-stream'
+PREAMBOLO = struct.Struct('<4sHH')
+
+
+def wants_binary(handler):
+    """True if the request of handler asks for the binary format."""
+    if handler.get_argument('formato', None) == 'binario':
+        return True
+    return accetta_binario(handler.request.headers.get('Accept', ''))
+
+
+def _qualita(accept):
+    """{media type: q} of the media ranges of an Accept header."""
+    qualita = {}
+    for voce in accept.split(','):
+        parti = voce.split(';')
+        tipo = parti[0].strip().lower()
+        if not tipo:
+            continue
+        q = 1.0
+        for parametro in parti[1:]:
+            nome, _, valore = parametro.partition('=')
+            if nome.strip().lower() == 'q':
+                try:
+                    q = float(valore)
+                except ValueError:
+                    q = 0.0
+        qualita[tipo] = q
+    return qualita
+
+
+def accetta_binario(accept):
+    """
+    True if the Accept header accept names MEDIA_TYPE with q > 0, and
+    with no lower q than application/json: wildcards do not opt in.
+    """
+    qualita = _qualita(accept)
+    q = qualita.get(MEDIA_TYPE, 0.0)
+    return q > 0 and q >= qualita.get('application/json', 0.0)
+
+
+def _header(finestra):
+    header = dict((k, v) for k, v in finestra.items() if k not in ('datiX', 'datiY', 'datiZ'))
+    header['campioni'] = len(finestra['datiX'])
+    testo = json.dumps(header).encode('utf-8')
+    return testo + b' ' * (-len(testo) % 4)
+
+
+def encode(finestre):
+    """
+    finestre: windows as dicts with numpy arrays datiX, datiY, datiZ of
+              the same length; every other key goes into the header
+    Returns the frames of all the windows, as bytes.
+    """
+    headers = [_header(f) for f in finestre]
+    dimensioni = [PREAMBOLO.size + len(h) + 12 * len(f['datiX'])
+                  for h, f in zip(headers, finestre)]
+    buf = np.empty(sum(dimensioni), dtype=np.uint8)
+    offset = 0
+    for h, f, dimensione in zip(headers, finestre, dimensioni):
+        PREAMBOLO.pack_into(buf, offset, MAGIC, VERSION, len(h))
+        inizio = offset + PREAMBOLO.size + len(h)
+        buf[offset + PREAMBOLO.size:inizio] = np.frombuffer(h, dtype=np.uint8)
+        dati = buf[inizio:offset + dimensione].view('<f4').reshape(3, len(f['datiX']))
+        for riga, asse in zip(dati, ('datiX', 'datiY', 'datiZ')):
+            riga[...] = f[asse]
+        offset += dimensione
+    return buf.tobytes()
+
+
+def decode(dati):
+    """Inverse of encode: list of (header, X, Y, Z), for clients and checks."""
+    finestre = []
+    offset = 0
+    while offset < len(dati):
+        magic, versione, n = PREAMBOLO.unpack_from(dati, offset)
+        if magic != MAGIC or versione != VERSION:
+            raise ValueError("not a version %d frame at byte %d" % (VERSION, offset))
+        header = json.loads(dati[offset + PREAMBOLO.size:offset + PREAMBOLO.size + n].decode('utf-8'))
+        k = header['campioni']
+        inizio = offset + PREAMBOLO.size + n
+        X, Y, Z = np.frombuffer(dati, dtype='<f4', count=3 * k, offset=inizio).reshape(3, k)
+        finestre.append((header, X, Y, Z))
+        offset = inizio + 12 * k
+    return finestre